@@ -14,6 +14,8 @@
 
 """QuecPython builtin Extensions"""
 
-from .clients import TcpClient, SmsClient
-from .uart import Uart
+from .clients import TcpClient, UdpClient, SmsClient
+from .uart import Uart, SerialMux
 from .network import network
+from .modbus import ModbusMaster
+from .bridge import Bridge
@@ -0,0 +1,253 @@
+# Copyright (c) Quectel Wireless Solution, Co., Ltd.All Rights Reserved.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import utime
+import urandom
+from .. import AppExtensionABC
+from ..threading import Thread, Event, Lock
+from ..qsocket import TcpSocket, SslTcpSocket
+from ..serial import Serial as _Serial
+from ..logging import getLogger
+
+logger = getLogger(__name__)
+
+
+class PumpStats(object):
+    """Counters of one bridge direction, latency is the time from a read returning to its data being written."""
+
+    def __init__(self):
+        self.bytes = 0
+        self.chunks = 0
+        self.dropped = 0
+        self.errors = 0
+        self.latency_total_us = 0
+        self.latency_max_us = 0
+        self.__window_bytes = 0
+        self.__window_start = utime.ticks_ms()
+
+    def record(self, size, latency_us):
+        self.bytes += size
+        self.chunks += 1
+        self.__window_bytes += size
+        self.latency_total_us += latency_us
+        if latency_us > self.latency_max_us:
+            self.latency_max_us = latency_us
+
+    def to_dict(self):
+        """counters, `bytes_per_s` is the throughput since the previous call."""
+        now = utime.ticks_ms()
+        elapsed = utime.ticks_diff(now, self.__window_start)
+        rate = self.__window_bytes * 1000 / elapsed if elapsed > 0 else 0
+        self.__window_bytes = 0
+        self.__window_start = now
+        return {
+            'bytes': self.bytes,
+            'chunks': self.chunks,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'bytes_per_s': rate,
+            'latency_avg_us': self.latency_total_us // self.chunks if self.chunks else 0,
+            'latency_max_us': self.latency_max_us,
+        }
+
+
+class Bridge(AppExtensionABC):
+    """Transparent UART <-> TCP pump for DTU use.
+
+    One thread reads the UART into a preallocated buffer and sends it on the socket, another reads the socket into a
+    second buffer and writes it to the UART, both on memoryview slices, without queues, copies nor per packet logs.
+    The downlink thread also (re)connects with exponential backoff.
+
+    Config `BRIDGE`: {'uart': `Serial` arguments (default config `UART`), 'server': `TcpSocket` arguments (default
+    config `TCP_SERVER`), 'ssl': None, 'buffer_size': 1024, 'send_timeout': 30, 'read_timeout': 5,
+    'offline': 'wait', 'reconnect_min': 1, 'reconnect_max': 120}.
+
+    'offline' is what the uplink does while disconnected: 'wait' stops reading the UART (with `flowctl` the UART
+    then holds the device back with RTS), 'drop' keeps reading and discards the data. 'read_timeout' bounds socket
+    reads so a link lost by the uplink side is noticed. 'ssl' is True or `SslTcpSocket` options.
+    """
+    WAIT = 'wait'
+    DROP = 'drop'
+
+    def __init__(self, name, app=None, uplink=None, downlink=None):
+        """
+        @uplink: transform hook for UART -> TCP data, called with a memoryview of the read buffer and returning the
+        buffer to send (the view itself, a slice of it, new bytes) or None to send nothing. The view is only valid
+        until the hook returns; it may be modified in place.
+        @downlink: the same for TCP -> UART data.
+        """
+        self.uplink = uplink
+        self.downlink = downlink
+        self.serial = None
+        self.sock = None
+        self.buffer_size = 1024
+        self.send_timeout = 30
+        self.offline = self.WAIT
+        self.reconnect_min = 1
+        self.reconnect_max = 120
+        self.up = PumpStats()
+        self.down = PumpStats()
+        self.reconnects = 0
+        self.__up_buf = None
+        self.__down_buf = None
+        self.__connected = Event()
+        self.__lock = Lock()
+        self.__up_thread = Thread(target=self.__uplink_thread_worker)
+        self.__down_thread = Thread(target=self.__downlink_thread_worker)
+        super().__init__(name, app=app)
+
+    def __str__(self):
+        return '{}({} <-> {})'.format(type(self).__name__, self.serial, self.sock)
+
+    def init_app(self, app):
+        options = app.config.get('BRIDGE', {})
+        self.serial = _Serial(**options.get('uart', app.config.get('UART', {})))
+        server = dict(options.get('server', app.config.get('TCP_SERVER', {})))
+        server.setdefault('timeout', options.get('read_timeout', 5))
+        if options.get('ssl'):
+            if isinstance(options['ssl'], dict):
+                server.update(options['ssl'])
+            self.sock = SslTcpSocket(**server)
+        else:
+            self.sock = TcpSocket(**server)
+        self.buffer_size = options.get('buffer_size', 1024)
+        self.send_timeout = options.get('send_timeout', 30)
+        self.offline = options.get('offline', self.WAIT)
+        if self.offline not in (self.WAIT, self.DROP):
+            raise ValueError('unknown bridge offline policy \"{}\".'.format(self.offline))
+        self.reconnect_min = options.get('reconnect_min', 1)
+        self.reconnect_max = options.get('reconnect_max', 120)
+        self.__up_buf = bytearray(self.buffer_size)
+        self.__down_buf = bytearray(self.buffer_size)
+        app.append_extension(self)
+
+    def load(self):
+        self.serial.open()
+        self.__down_thread.start()
+        self.__up_thread.start()
+
+    def is_connected(self):
+        return self.__connected.is_set()
+
+    def stats(self):
+        return {
+            'connected': self.__connected.is_set(),
+            'reconnects': self.reconnects,
+            'uplink': self.up.to_dict(),
+            'downlink': self.down.to_dict(),
+        }
+
+    def __connect(self):
+        delay = self.reconnect_min
+        while True:
+            logger.info('{} connecting...'.format(self.sock))
+            try:
+                self.sock.connect()
+            except Exception as e:
+                logger.error('{} connect failed: {}'.format(self.sock, e), key='connect')
+                self.sock.disconnect()
+                utime.sleep_ms(int(max(0, delay + urandom.uniform(-delay / 2, delay / 2)) * 1000))
+                delay = min(delay * 2, self.reconnect_max)
+                continue
+            logger.info('{} connected'.format(self.sock))
+            self.__connected.set()
+            return
+
+    def __lost(self, error):
+        with self.__lock:
+            if not self.__connected.is_set():
+                return
+            self.__connected.clear()
+            self.reconnects += 1
+            logger.warn('{} link lost: {}; try to reconnect.'.format(self.sock, error))
+            self.sock.disconnect()
+
+    def __write_serial(self, data):
+        view = memoryview(data)
+        written = 0
+        while written < len(view):
+            size = self.serial.write(view[written:])
+            if not size:
+                self.down.dropped += len(view) - written
+                break
+            written += size
+
+    def __uplink_thread_worker(self):
+        view = memoryview(self.__up_buf)
+        while True:
+            if self.offline == self.WAIT:
+                self.__connected.wait()
+            try:
+                size = self.serial.readinto(self.__up_buf)
+            except Exception as e:
+                self.up.errors += 1
+                logger.error('{} serial read error: {}'.format(self, e), key='read')
+                continue
+            begin = utime.ticks_us()
+            data = view[:size]
+            if self.uplink is not None:
+                try:
+                    data = self.uplink(data)
+                except Exception as e:
+                    self.up.errors += 1
+                    logger.error('{} uplink hook error: {}'.format(self, e), key='uplink')
+                    continue
+                if not data:
+                    continue
+            if not self.__connected.is_set():
+                self.up.dropped += len(data)
+                continue
+            try:
+                self.sock.sendall(data, timeout=self.send_timeout)
+            except Exception as e:
+                self.up.errors += 1
+                self.up.dropped += len(data)
+                self.__lost(e)
+                continue
+            self.up.record(len(data), utime.ticks_diff(utime.ticks_us(), begin))
+
+    def __downlink_thread_worker(self):
+        view = memoryview(self.__down_buf)
+        while True:
+            if not self.__connected.is_set():
+                self.__connect()
+            try:
+                size = self.sock.readinto(self.__down_buf)
+            except TcpSocket.TimeoutError:
+                continue
+            except Exception as e:
+                self.__lost(e)
+                continue
+            if not size:
+                self.__lost('closed by peer')
+                continue
+            begin = utime.ticks_us()
+            data = view[:size]
+            if self.downlink is not None:
+                try:
+                    data = self.downlink(data)
+                except Exception as e:
+                    self.down.errors += 1
+                    logger.error('{} downlink hook error: {}'.format(self, e), key='downlink')
+                    continue
+                if not data:
+                    continue
+            try:
+                self.__write_serial(data)
+            except Exception as e:
+                self.down.errors += 1
+                self.down.dropped += len(data)
+                logger.error('{} serial write error: {}'.format(self, e), key='write')
+                continue
+            self.down.record(len(data), utime.ticks_diff(utime.ticks_us(), begin))
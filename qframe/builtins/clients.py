@@ -13,34 +13,343 @@
 # limitations under the License.
 
 import sms
+import utime
+import uselect
 from .. import AppExtensionABC
-from ..threading import Condition, Thread, Queue
-from ..datetime import DateTime, TimeDelta
-from ..qsocket import TcpSocket
+from ..threading import Condition, Thread, Queue, Lock, RateLimiter, Backpressure
+from ..qsocket import TcpSocket, SslTcpSocket, UdpSocket, resolver, reactor
+from ..collections import PersistentQueue
+from ..codecs import make_decoder
 from ..logging import getLogger
+from .transports import ThreadedTransport, ReactorTransport
+from .pipeline import UplinkPipeline
 
 
 logger = getLogger(__name__)
 
 
+class Outbox(object):
+    """Bounded FIFO of messages waiting for the connection, limited to `max_items` messages and `max_bytes` bytes.
+
+    Overflow `policy`: 'drop_oldest' evicts queued messages to make room, 'reject' refuses the new one, 'block'
+    waits up to the `put` timeout for room, then refuses. A `Backpressure` given as `backpressure` is updated with
+    the queued bytes on every change.
+    """
+    DROP_OLDEST = 'drop_oldest'
+    REJECT = 'reject'
+    BLOCK = 'block'
+
+    def __init__(self, max_items=64, max_bytes=16384, policy=DROP_OLDEST, backpressure=None):
+        if policy not in (self.DROP_OLDEST, self.REJECT, self.BLOCK):
+            raise ValueError('unknown outbox policy \"{}\".'.format(policy))
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.backpressure = backpressure
+        self.dropped = 0
+        self.rejected = 0
+        self.__items = []
+        self.__bytes = 0
+        self.__inflight = 0
+        self.__woken = False
+        self.__cond = Condition()
+
+    def __len__(self):
+        with self.__cond:
+            return len(self.__items)
+
+    @staticmethod
+    def size_of(item):
+        if isinstance(item, (list, tuple)):
+            return sum([len(buf) for buf in item])
+        return len(item)
+
+    def bytes(self):
+        with self.__cond:
+            return self.__bytes
+
+    def __fits(self, size):
+        return len(self.__items) < self.max_items and self.__bytes + size <= self.max_bytes
+
+    def __changed(self):
+        # called with the lock held so levels reach the watermarks in order
+        if self.backpressure is not None:
+            self.backpressure.update(self.__bytes)
+        self.__cond.notify_all()
+
+    def put(self, item, timeout=None):
+        """returns True if queued, False if refused."""
+        size = self.size_of(item)
+        with self.__cond:
+            if size > self.max_bytes:
+                self.rejected += 1
+                return False
+            if not self.__fits(size):
+                if self.policy == self.DROP_OLDEST:
+                    while not self.__fits(size):
+                        self.__bytes -= self.size_of(self.__items.pop(0))
+                        self.dropped += 1
+                elif self.policy == self.REJECT or timeout == 0 or \
+                        not self.__cond.wait_for(lambda: self.__fits(size), timeout=timeout):
+                    self.rejected += 1
+                    return False
+            self.__items.append(item)
+            self.__bytes += size
+            self.__changed()
+            return True
+
+    def get(self, timeout=None):
+        """take the oldest message, None on timeout or `wakeup`. call `done` or `requeue` once it is handled."""
+        with self.__cond:
+            if not self.__cond.wait_for(lambda: len(self.__items) != 0 or self.__woken, timeout=timeout):
+                return None
+            if self.__woken:
+                self.__woken = False
+                return None
+            item = self.__items.pop(0)
+            self.__bytes -= self.size_of(item)
+            self.__inflight += 1
+            self.__changed()
+            return item
+
+    def wakeup(self):
+        """make the current or next `get` return None at once."""
+        with self.__cond:
+            self.__woken = True
+            self.__cond.notify_all()
+
+    def done(self):
+        with self.__cond:
+            self.__inflight -= 1
+            self.__cond.notify_all()
+
+    def requeue(self, item):
+        """put a message that could not be sent back at the head."""
+        with self.__cond:
+            self.__items.insert(0, item)
+            self.__bytes += self.size_of(item)
+            self.__inflight -= 1
+            self.__changed()
+
+    def wait_empty(self, timeout=None):
+        with self.__cond:
+            return self.__cond.wait_for(lambda: not self.__items and not self.__inflight, timeout=timeout)
+
+    def clear(self):
+        with self.__cond:
+            self.__items.clear()
+            self.__bytes = 0
+            self.__changed()
+
+
+class Heartbeat(object):
+    """Application level ping/pong with RTT estimate and dead link detection.
+
+    A `ping` frame is sent every `interval` s; a pong not received within the timeout (smoothed RTT + 4 * RTT
+    variance, kept in [`min_timeout`, `max_timeout`] and doubled on every miss) counts as missed and the ping is
+    repeated at once. After `max_missed` missed pongs in a row the link is dead. Override `make_ping` / `is_pong`
+    for frames carrying ids or timestamps.
+    """
+
+    def __init__(self, interval=30, max_missed=3, ping=b'PING\n', pong=b'PONG\n', min_timeout=1, max_timeout=10):
+        self.interval = interval
+        self.max_missed = max_missed
+        self.ping = ping.encode() if isinstance(ping, str) else ping
+        self.pong = pong.encode() if isinstance(pong, str) else pong
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout = max_timeout
+        self.srtt = None
+        self.rttvar = None
+        self.last_rtt = None
+        self.max_rtt = None
+        self.sent = 0
+        self.received = 0
+        self.missed = 0
+        self.late = 0
+        self.dead = 0
+        self.__lock = Lock()
+        self.__sent_at = None
+        self.__last_ping = None
+        self.__missed = 0
+
+    def make_ping(self):
+        return self.ping
+
+    def is_pong(self, data):
+        return len(data) == len(self.pong) and bytes(data) == self.pong
+
+    def reset(self):
+        """new connection: forget the outstanding ping, the next tick pings at once."""
+        with self.__lock:
+            self.__sent_at = None
+            self.__last_ping = None
+            self.__missed = 0
+
+    def on_pong(self, now):
+        with self.__lock:
+            if self.__sent_at is None:
+                self.late += 1
+                return
+            rtt = utime.ticks_diff(now, self.__sent_at) / 1000
+            self.__sent_at = None
+            self.__missed = 0
+            self.received += 1
+            self.last_rtt = rtt
+            if self.max_rtt is None or rtt > self.max_rtt:
+                self.max_rtt = rtt
+            if self.srtt is None:
+                self.srtt = rtt
+                self.rttvar = rtt / 2
+            else:
+                self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+                self.srtt = 0.875 * self.srtt + 0.125 * rtt
+            self.timeout = min(self.max_timeout, max(self.min_timeout, self.srtt + 4 * self.rttvar))
+
+    def tick(self, now):
+        """returns (action, delay): action is 'ping' (send `make_ping()` now), 'dead' or None, `delay` is the time
+        (s) until the next tick."""
+        with self.__lock:
+            if self.__sent_at is not None:
+                waited = utime.ticks_diff(now, self.__sent_at)
+                timeout = int(self.timeout * 1000)
+                if waited < timeout:
+                    return None, (timeout - waited) / 1000
+                self.__sent_at = None
+                self.missed += 1
+                self.__missed += 1
+                self.timeout = min(self.max_timeout, self.timeout * 2)
+                if self.__missed >= self.max_missed:
+                    self.dead += 1
+                    self.__missed = 0
+                    return 'dead', self.interval
+            elif self.__last_ping is not None:
+                left = int(self.interval * 1000) - utime.ticks_diff(now, self.__last_ping)
+                if left > 0:
+                    return None, left / 1000
+            self.__sent_at = now
+            self.__last_ping = now
+            self.sent += 1
+            return 'ping', min(self.timeout, self.interval)
+
+    def to_dict(self):
+        return {
+            'srtt': self.srtt,
+            'rttvar': self.rttvar,
+            'timeout': self.timeout,
+            'last_rtt': self.last_rtt,
+            'max_rtt': self.max_rtt,
+            'sent': self.sent,
+            'received': self.received,
+            'missed': self.missed,
+            'late': self.late,
+            'dead': self.dead,
+        }
+
+
 class TcpClient(AppExtensionABC):
+    """TCP client with auto reconnect.
 
-    def __init__(self, name, app=None):
+    `send` only queues into a bounded outbox and returns at once, a sender thread writes it out while connected.
+    Connections are handled by a `transports.Transport`, framing, aggregation and compression by a
+    `pipeline.UplinkPipeline`. Options come from config `TCP_CLIENT`, see docs/tcp_client.md.
+    """
+
+    def __init__(self, name, app=None, zero_copy=False, codec=None, reactor=None, heartbeat=None):
+        """@zero_copy: read into a reused buffer and pass memoryview slices to `recv_callback`, the memoryview is
+        only valid until the callback returns.
+        @codec: a `qframe.codecs.FrameDecoder` splitting the stream into messages, or set from config
+        `TCP_CLIENT['codec']` (`make_decoder` options, e.g. {'type': 'length', 'length_size': 2, 'max_size': 4096}).
+        Complete messages of every read are passed as a list of bytes to `recv_messages`.
+        @reactor: `qframe.qsocket.Reactor` serving this client instead of its own threads.
+        @heartbeat: `Heartbeat` checking the link."""
         self.__sock = None
-        self.__listen_thread = Thread(target=self.__listen_thread_worker)
-        self.__reconn_cond = Condition()
-        self.__reconn_thread = Thread(target=self.__reconn_thread_worker)
+        self.reactor = reactor
+        self.heartbeat = heartbeat
+        self.transport = None
+        self.pipeline = None
+        self.__tx_lock = Lock()
+        self.limiter = None
+        self.backpressure = None
+        self.zero_copy = zero_copy
+        self.codec = codec
+        self.rx_bytes = 0
+        self.rx_messages = 0
+        self.__batch = []
+        self.outbox = None
+        self.send_timeout = 30
+        self.spool = None
+        self.spooled = 0
+        self.replayed = 0
+        self.__ping_due = False
+        self.__send_thread = Thread(target=self.__send_thread_worker)
         super().__init__(name, app=app)
 
     def __str__(self):
         return str(self.sock)
 
     def init_app(self, app):
-        self.__sock = TcpSocket(**app.config['TCP_SERVER'])
+        resolver.configure(**app.config.get('DNS', {}))
+        options = app.config.get('TCP_CLIENT', {})
+        if options.get('ssl'):
+            kwargs = dict(app.config['TCP_SERVER'])
+            if isinstance(options['ssl'], dict):
+                kwargs.update(options['ssl'])
+            self.__sock = SslTcpSocket(**kwargs)
+        else:
+            self.__sock = TcpSocket(**app.config['TCP_SERVER'])
+        max_bytes = options.get('outbox_bytes', 16384)
+        if options.get('backpressure'):
+            watermarks = options['backpressure'] if isinstance(options['backpressure'], dict) else {}
+            self.backpressure = Backpressure(
+                high=watermarks.get('high', max_bytes * 3 // 4), low=watermarks.get('low', max_bytes // 4)
+            )
+        self.outbox = Outbox(
+            max_items=options.get('outbox_size', 64),
+            max_bytes=max_bytes,
+            policy=options.get('overflow', Outbox.DROP_OLDEST),
+            backpressure=self.backpressure
+        )
+        self.send_timeout = options.get('send_timeout', 30)
+        if self.codec is None and options.get('codec'):
+            self.codec = make_decoder(**options['codec'])
+        if self.codec is not None:
+            # messages of a batch outlive the next fragment, they cannot be views of the reassembly buffer
+            self.codec.copy = True
+        if options.get('spool'):
+            self.spool = PersistentQueue(**options['spool'])
+        if self.heartbeat is None and options.get('heartbeat'):
+            self.heartbeat = Heartbeat(**options['heartbeat'])
+        self.pipeline = UplinkPipeline(
+            self.__deliver, aggregate=options.get('aggregate'), compression=options.get('compression')
+        )
+        if options.get('rate_limit'):
+            self.limiter = RateLimiter(**options['rate_limit'])
+        kwargs = dict(
+            on_connect=self.__on_connect,
+            on_heartbeat=None if self.heartbeat is None else self.__heartbeat_step,
+            zero_copy=self.zero_copy,
+            reconnect_min=options.get('reconnect_min', 1),
+            reconnect_max=options.get('reconnect_max', 120),
+            reconnect_factor=options.get('reconnect_factor', 2),
+            reconnect_jitter=options.get('reconnect_jitter', 0.5)
+        )
+        if self.reactor is None and options.get('reactor'):
+            self.reactor = reactor
+        if self.reactor is not None:
+            self.transport = ReactorTransport(
+                self.__sock, self.__dispatch, reactor=self.reactor, idle_timeout=options.get('idle_timeout'),
+                connect_timeout=options.get('connect_timeout', 30), **kwargs
+            )
+        else:
+            self.transport = ThreadedTransport(self.__sock, self.__dispatch, **kwargs)
+        if 'network' in app.extensions:
+            app.extensions['network'].register_net_callback(self.transport.net_callback)
         app.append_extension(self)
 
     def load(self):
-        self.connect()
+        self.__send_thread.start()
+        self.transport.start()
 
     @property
     def sock(self):
@@ -48,69 +357,444 @@ class TcpClient(AppExtensionABC):
             raise ValueError('client not init.')
         return self.__sock
 
+    def is_connected(self):
+        return self.transport is not None and self.transport.is_connected()
+
+    def connect(self):
+        return self.transport.connect()
+
+    def disconnect(self):
+        return self.transport.disconnect()
+
     def recv_callback(self, data):
         raise NotImplementedError('you must implement this method to handle data received by tcp.')
 
-    def __listen_thread_worker(self):
-        while True:
+    def recv_messages(self, messages):
+        """called with the complete messages decoded from one read when a codec is set, override it to handle a
+        batch at once. passes each message to `recv_callback` by default."""
+        for message in messages:
+            self.recv_callback(message)
+
+    def rx_stats(self):
+        stats = {'bytes': self.rx_bytes, 'messages': self.rx_messages}
+        if self.codec is not None:
+            stats['overflows'] = self.codec.overflows
+        return stats
+
+    def __on_connect(self):
+        # drop a message cut by the previous connection
+        if self.codec is not None:
+            self.codec.reset()
+        self.pipeline.reset()
+        if self.heartbeat is not None:
+            self.heartbeat.reset()
+
+    def __pong(self, data):
+        if self.heartbeat is not None and self.heartbeat.is_pong(data):
+            self.heartbeat.on_pong(utime.ticks_ms())
+            return True
+        return False
+
+    def __dispatch(self, data):
+        self.rx_bytes += len(data)
+        self.pipeline.feed(data)
+
+    def __deliver(self, data):
+        if self.codec is None:
+            if not self.__pong(data):
+                self.rx_messages += 1
+                self.recv_callback(data)
+            return
+        self.codec.feed(data, self.__batch.append)
+        if self.__batch:
+            messages = self.__batch
+            self.__batch = []
+            if self.heartbeat is not None:
+                messages = [message for message in messages if not self.__pong(message)]
+            if messages:
+                self.rx_messages += len(messages)
+                self.recv_messages(messages)
+
+    def __heartbeat_step(self):
+        """one heartbeat tick, returns the delay (s) until the next one."""
+        action, delay = self.heartbeat.tick(utime.ticks_ms())
+        if action == 'ping':
+            # written by the sender thread, a blocking write here would stall the reactor
+            self.__ping_due = True
+            self.outbox.wakeup()
+        elif action == 'dead':
+            logger.warn('missed pongs, link is dead; try to reconnect.', self, self.heartbeat.max_missed)
+            self.transport.lost()
+        return delay
+
+    def rtt_stats(self):
+        """heartbeat RTT estimate (s) and counters, None without heartbeat."""
+        if self.heartbeat is None:
+            return None
+        return self.heartbeat.to_dict()
+
+    def reconnect_stats(self):
+        """reconnect counters, `*_ms` is the time from losing the link to being connected again."""
+        return self.transport.stats()
+
+    def compression_stats(self):
+        """envelope counters, `ratio` is bytes sent / bytes given (lower is better)."""
+        return self.pipeline.compression_stats()
+
+    def batch_stats(self):
+        """aggregation counters: batches (packets written), messages, bytes and why each batch was closed."""
+        return self.pipeline.batch_stats()
+
+    def __write(self, data, throttle=False, framed=False):
+        """write one packet through the pipeline (see `UplinkPipeline.encode`) and the rate limit."""
+        data = self.pipeline.encode(data, framed=framed)
+        if throttle and self.limiter is not None:
+            self.limiter.acquire(sum(len(part) for part in data) if isinstance(data, (list, tuple)) else len(data))
+        with self.__tx_lock:
+            if isinstance(data, (list, tuple)):
+                self.sock.sendv(data, timeout=self.send_timeout)
+            else:
+                self.sock.sendall(data, timeout=self.send_timeout)
+
+    def __send_ping(self):
+        self.__ping_due = False
+        if not self.transport.is_connected():
+            return
+        try:
+            self.__write(self.heartbeat.make_ping())
+        except Exception as e:
+            logger.error('ping error, try to reconnect:', self, e, key='send')
+            self.transport.lost()
+
+    def __replay_spool(self):
+        while self.transport.is_connected():
+            if self.__ping_due:
+                self.__send_ping()
+            data = self.spool.peek()
+            if data is None:
+                break
             try:
-                data = self.sock.read(1024)
-            except self.sock.TimeoutError:
-                # logger.debug('{} read timeout'.format(self))
-                continue
+                self.__write(data, throttle=True)
             except Exception as e:
-                logger.error('{} read error: {}'.format(self, e))
-                with self.__reconn_cond:
-                    self.__reconn_thread.start()
-                    self.__reconn_cond.notify()
+                logger.error('cloud send error, try to reconnect:', e, key='send')
+                self.transport.lost()
                 break
-            else:
-                try:
-                    self.recv_callback(data)
-                except Exception as e:
-                    logger.error('recv_callback error: {}'.format(e))
+            self.spool.ack()
+            self.replayed += 1
 
-    def disconnect(self):
-        logger.info('{} disconnect'.format(self))
+    def __send_batch(self, first):
+        items, reason = self.pipeline.collect(first, self.outbox)
+        packet = self.pipeline.pack(items)
         try:
-            self.sock.disconnect()
-            self.__listen_thread.stop()
+            self.__write(packet, throttle=True, framed=True)
         except Exception as e:
-            logger.error('{} disconnect failed: {}'.format(self, e))
+            logger.error('cloud send error, try to reconnect:', e, key='send')
+            for item in reversed(items):
+                self.outbox.requeue(item)
+            self.transport.lost()
+            return
+        self.pipeline.count_batch(items, packet, reason)
+        for _ in items:
+            self.outbox.done()
+
+    def __send_thread_worker(self):
+        while True:
+            if self.__ping_due:
+                self.__send_ping()
+            if self.spool is not None and len(self.spool):
+                self.transport.wait_connected()
+                # the outbox only holds messages queued before spooling started
+                if not len(self.outbox):
+                    self.__replay_spool()
+                    continue
+            data = self.outbox.get(timeout=None if self.spool is None else 1)
+            if data is None:
+                continue
+            self.transport.wait_connected()
+            if self.pipeline.aggregate_bytes:
+                self.__send_batch(data)
+                continue
+            try:
+                self.__write(data, throttle=True)
+            except Exception as e:
+                logger.error('cloud send error, try to reconnect:', e, key='send')
+                self.outbox.requeue(data)
+                self.transport.lost()
+            else:
+                self.outbox.done()
+
+    def send(self, data, timeout=None, flush=False):
+        """queue `data` and return at once: True if queued, False if the outbox refused it (see `Outbox` policy,
+        `timeout` only applies to the 'block' policy). A list or tuple of buffers is sent back to back without
+        joining them. With a spool, messages go to flash while disconnected or while older ones wait for replay.
+        With aggregation, `flush` sends the current batch as soon as this message is in it."""
+        if self.spool is not None and (not self.transport.is_connected() or len(self.spool)):
+            if isinstance(data, (list, tuple)):
+                data = b''.join(data)
+            try:
+                self.spool.put(data)
+            except Exception as e:
+                logger.error('spool error:', self, e, key='spool')
+                return False
+            self.spooled += 1
+            return True
+        if not self.outbox.put(data, timeout=timeout):
             return False
+        if flush:
+            self.pipeline.request_flush()
         return True
 
+    def flush(self, timeout=None):
+        """wait until every queued message has been written to the socket, returns False on timeout."""
+        return self.outbox.wait_empty(timeout=timeout)
+
+    def rate_stats(self):
+        return None if self.limiter is None else self.limiter.stats()
+
+    def spool_stats(self):
+        if self.spool is None:
+            return None
+        return {
+            'pending': len(self.spool),
+            'spooled': self.spooled,
+            'replayed': self.replayed,
+            'dropped_segments': self.spool.dropped_segments,
+            'corrupt_records': self.spool.corrupt_records,
+        }
+
+
+class UdpClient(AppExtensionABC):
+    """UDP client for high rate records (telemetry).
+
+    `send` coalesces records into datagrams of up to `mtu` bytes, a datagram leaves when the next record would not
+    fit, after `max_delay` seconds or on `send(..., flush=True)`. Every record is prefixed with its 2 byte length so
+    the receiver can split datagrams again; with `sequence` each datagram starts with a 4 byte sequence number and
+    the receiving side counts lost and late datagrams. Both peers must use the same `coalesce` / `sequence`
+    settings, with `coalesce` False every record is sent as is in its own datagram.
+
+    The receive loop drains every datagram already queued on the socket after each wakeup and passes their records
+    as one list to `recv_messages`.
+
+    Config: `UDP_SERVER` holds the `UdpSocket` arguments, `UDP_CLIENT` the options {'mtu': 1200, 'max_delay': 0.02,
+    'coalesce': True, 'sequence': False, 'rx_size': 1500, 'max_batch': 32}.
+    """
+    LENGTH_SIZE = 2
+    SEQUENCE_SIZE = 4
+
+    def __init__(self, name, app=None):
+        self.__sock = None
+        self.mtu = 1200
+        self.max_delay = 0.02
+        self.coalesce = True
+        self.sequence = False
+        self.rx_size = 1500
+        self.max_batch = 32
+        self.__cond = Condition()
+        self.__buffer = None
+        self.__size = 0
+        self.__deadline = 0
+        self.__tx_seq = 0
+        self.__rx_seq = None
+        self.__stats = {
+            'tx_datagrams': 0, 'tx_records': 0, 'tx_bytes': 0, 'tx_errors': 0,
+            'rx_datagrams': 0, 'rx_records': 0, 'rx_bytes': 0, 'lost': 0, 'late': 0, 'malformed': 0,
+        }
+        self.__listen_thread = Thread(target=self.__listen_thread_worker)
+        self.__flush_thread = Thread(target=self.__flush_thread_worker)
+        super().__init__(name, app=app)
+
+    def __str__(self):
+        return str(self.sock)
+
+    def init_app(self, app):
+        resolver.configure(**app.config.get('DNS', {}))
+        self.__sock = UdpSocket(**app.config['UDP_SERVER'])
+        options = app.config.get('UDP_CLIENT', {})
+        self.mtu = options.get('mtu', 1200)
+        self.max_delay = options.get('max_delay', 0.02)
+        self.coalesce = options.get('coalesce', True)
+        self.sequence = options.get('sequence', False)
+        self.rx_size = options.get('rx_size', 1500)
+        self.max_batch = options.get('max_batch', 32)
+        self.__buffer = bytearray(self.mtu)
+        self.__size = self.__header_size()
+        app.append_extension(self)
+
+    def load(self):
+        self.connect()
+        self.__listen_thread.start()
+        self.__flush_thread.start()
+
+    @property
+    def sock(self):
+        if self.__sock is None:
+            raise ValueError('client not init.')
+        return self.__sock
+
     def connect(self):
-        logger.info('{} connecting...'.format(self))
         try:
+            self.sock.disconnect()
             self.sock.connect()
         except Exception as e:
-            logger.error('{} connect failed: {}'.format(self, e))
+            logger.error('connect failed:', self, e, key='connect')
             return False
-        self.__listen_thread.start()
-        logger.info('{} connect successfully'.format(self))
+        logger.info('connect successfully', self)
+        return True
+
+    def recv_callback(self, data):
+        raise NotImplementedError('you must implement this method to handle data received by udp.')
+
+    def recv_messages(self, messages):
+        """called with the records of all datagrams drained in one wakeup, passes each to `recv_callback` by
+        default."""
+        for message in messages:
+            self.recv_callback(message)
+
+    def stats(self):
+        with self.__cond:
+            return dict(self.__stats)
+
+    def __header_size(self):
+        return self.SEQUENCE_SIZE if self.sequence else 0
+
+    def __send_datagram(self, data):
+        """called with `__cond` held, so datagrams leave in order."""
+        if self.sequence:
+            data[:self.SEQUENCE_SIZE] = self.__tx_seq.to_bytes(self.SEQUENCE_SIZE, 'big')
+            self.__tx_seq = (self.__tx_seq + 1) & 0xFFFFFFFF
+        try:
+            self.sock.write(data)
+        except Exception as e:
+            self.__stats['tx_errors'] += 1
+            logger.error('send error:', self, e, key='send')
+            return False
+        self.__stats['tx_datagrams'] += 1
+        self.__stats['tx_bytes'] += len(data)
         return True
 
-    def __reconn_thread_worker(self):
-        with self.__reconn_cond:
-            self.disconnect()
-            while not self.connect():
-                last_reconn_time = DateTime.now()
-                self.disconnect()
-                self.__reconn_cond.wait_for(
-                    lambda: DateTime.now() - last_reconn_time > TimeDelta(seconds=10),
-                    timeout=60
-                )
-
-    def send(self, data):
-        with self.__reconn_cond:
+    def __flush_locked(self):
+        header = self.__header_size()
+        if self.__size <= header:
+            return True
+        size = self.__size
+        self.__size = header
+        return self.__send_datagram(memoryview(self.__buffer)[:size])
+
+    def send(self, data, flush=False):
+        """queue one record, returns False if a datagram failed to send."""
+        header = self.__header_size()
+        with self.__cond:
+            self.__stats['tx_records'] += 1
+            if not self.coalesce:
+                return self.__send_datagram(bytearray(header) + data)
+            need = self.LENGTH_SIZE + len(data)
+            if need > 0xFFFF + self.LENGTH_SIZE:
+                raise ValueError('record too large.')
+            ok = True
+            if self.__size + need > self.mtu:
+                ok = self.__flush_locked()
+            if header + need > self.mtu:
+                # larger than one datagram, sent alone and left to IP fragmentation
+                datagram = bytearray(header) + len(data).to_bytes(self.LENGTH_SIZE, 'big') + data
+                return self.__send_datagram(datagram) and ok
+            view = memoryview(self.__buffer)
+            if self.__size == header:
+                self.__deadline = utime.ticks_add(utime.ticks_ms(), int(self.max_delay * 1000))
+                self.__cond.notify()
+            view[self.__size:self.__size + self.LENGTH_SIZE] = len(data).to_bytes(self.LENGTH_SIZE, 'big')
+            view[self.__size + self.LENGTH_SIZE:self.__size + need] = data
+            self.__size += need
+            if flush or self.__size + self.LENGTH_SIZE >= self.mtu:
+                ok = self.__flush_locked() and ok
+            return ok
+
+    def flush(self):
+        with self.__cond:
+            return self.__flush_locked()
+
+    def __flush_thread_worker(self):
+        with self.__cond:
+            while True:
+                if self.__size <= self.__header_size():
+                    self.__cond.wait()
+                    continue
+                remaining = utime.ticks_diff(self.__deadline, utime.ticks_ms())
+                if remaining > 0:
+                    self.__cond.wait(remaining / 1000)
+                    continue
+                self.__flush_locked()
+
+    def __check_sequence(self, seq):
+        if self.__rx_seq is None:
+            self.__rx_seq = seq
+        diff = (seq - self.__rx_seq) & 0xFFFFFFFF
+        if diff < 0x80000000:
+            self.__stats['lost'] += diff
+            self.__rx_seq = (seq + 1) & 0xFFFFFFFF
+        else:
+            # reordered or duplicated, already counted as lost
+            self.__stats['late'] += 1
+
+    def __split(self, datagram, messages):
+        stats = self.__stats
+        stats['rx_datagrams'] += 1
+        stats['rx_bytes'] += len(datagram)
+        pos = 0
+        if self.sequence:
+            if len(datagram) < self.SEQUENCE_SIZE:
+                stats['malformed'] += 1
+                return
+            self.__check_sequence(int.from_bytes(datagram[:self.SEQUENCE_SIZE], 'big'))
+            pos = self.SEQUENCE_SIZE
+        if not self.coalesce:
+            messages.append(datagram[pos:] if pos else datagram)
+            stats['rx_records'] += 1
+            return
+        end = len(datagram)
+        while pos < end:
+            size = int.from_bytes(datagram[pos:pos + self.LENGTH_SIZE], 'big')
+            pos += self.LENGTH_SIZE
+            if pos + size > end:
+                stats['malformed'] += 1
+                return
+            messages.append(datagram[pos:pos + size])
+            stats['rx_records'] += 1
+            pos += size
+
+    def __listen_thread_worker(self):
+        poller = None
+        while True:
+            if poller is None:
+                try:
+                    poller = uselect.poll()
+                    poller.register(self.sock.sock, uselect.POLLIN)
+                except Exception:
+                    poller = None
+                    utime.sleep(1)
+                    self.connect()
+                    continue
             try:
-                return self.sock.write(data)
+                datagrams = [self.sock.read(self.rx_size)]
+                # drain what is already queued without waiting again
+                while len(datagrams) < self.max_batch and poller.poll(0):
+                    datagrams.append(self.sock.read(self.rx_size))
+            except self.sock.TimeoutError:
+                continue
             except Exception as e:
-                logger.error('cloud send error: {}; try to reconnect.'.format(e))
-                self.__reconn_thread.start()
-                self.__reconn_cond.notify()
-                return False
+                logger.error('read error:', self, e, key='read')
+                poller = None
+                utime.sleep(1)
+                self.connect()
+                continue
+            messages = []
+            with self.__cond:
+                for datagram in datagrams:
+                    self.__split(datagram, messages)
+            if messages:
+                try:
+                    self.recv_messages(messages)
+                except Exception as e:
+                    logger.error('recv_callback error:', e)
 
 
 class SmsClient(AppExtensionABC):
@@ -143,7 +827,7 @@ class SmsClient(AppExtensionABC):
                 else:
                     logger.warn('got msg failed!')
             except Exception as e:
-                logger.error('git msg error: {}'.format(e))
+                logger.error('git msg error:', e)
                 continue
 
     def recv_callback(self, phone, msg, length):
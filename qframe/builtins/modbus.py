@@ -0,0 +1,374 @@
+# Copyright (c) Quectel Wireless Solution, Co., Ltd.All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import utime
+from .. import AppExtensionABC
+from ..threading import Thread, Lock, Condition
+from ..serial import Serial as _Serial, idle_gap_ms
+from ..logging import getLogger
+
+logger = getLogger(__name__)
+
+
+def _crc_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+
+_CRC_TABLE = _crc_table()
+
+
+def crc16(data, crc=0xFFFF):
+    """Modbus CRC16 (poly 0xA001, init 0xFFFF), table driven."""
+    table = _CRC_TABLE
+    for b in data:
+        crc = (crc >> 8) ^ table[(crc ^ b) & 0xFF]
+    return crc
+
+
+# max registers/bits a single read request may ask for, by function code
+_MAX_COUNT = {1: 2000, 2: 2000, 3: 125, 4: 125}
+
+
+class SlaveStats(object):
+    """Per-slave statistics and adaptive response timeout (smoothed RTT + 4 * RTT variance)."""
+
+    def __init__(self, min_timeout, max_timeout):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout = max_timeout
+        self.srtt = None
+        self.rttvar = None
+        self.requests = 0
+        self.responses = 0
+        self.timeouts = 0
+        self.crc_errors = 0
+        self.exceptions = 0
+        self.mismatches = 0
+        self.last_latency = None
+        self.max_latency = None
+
+    def on_response(self, latency):
+        self.responses += 1
+        self.last_latency = latency
+        if self.max_latency is None or latency > self.max_latency:
+            self.max_latency = latency
+        if self.srtt is None:
+            self.srtt = latency
+            self.rttvar = latency / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - latency)
+            self.srtt = 0.875 * self.srtt + 0.125 * latency
+        self.timeout = min(self.max_timeout, max(self.min_timeout, self.srtt + 4 * self.rttvar))
+
+    def on_timeout(self):
+        self.timeouts += 1
+        # back off until the next response re-estimates
+        self.timeout = min(self.max_timeout, self.timeout * 2)
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'responses': self.responses,
+            'timeouts': self.timeouts,
+            'crc_errors': self.crc_errors,
+            'exceptions': self.exceptions,
+            'mismatches': self.mismatches,
+            'srtt': self.srtt,
+            'rttvar': self.rttvar,
+            'timeout': self.timeout,
+            'last_latency': self.last_latency,
+            'max_latency': self.max_latency,
+        }
+
+
+class Poll(object):
+    """A periodic read of `count` registers (or bits) from `slave`, `callback(values)` gets the result."""
+
+    def __init__(self, slave, address, count, function=3, interval=1.0, callback=None):
+        if function not in _MAX_COUNT:
+            raise ValueError('poll function should be one of {}.'.format(list(_MAX_COUNT.keys())))
+        if not 0 < count <= _MAX_COUNT[function]:
+            raise ValueError('count should be between 1 and {}.'.format(_MAX_COUNT[function]))
+        self.slave = slave
+        self.address = address
+        self.count = count
+        self.function = function
+        self.interval = interval
+        self.callback = callback
+        self.due = utime.ticks_ms()
+        self.errors = 0
+
+    def __str__(self):
+        return '<Poll slave={},fc={},{}+{}>'.format(self.slave, self.function, self.address, self.count)
+
+
+class ModbusMaster(AppExtensionABC):
+    """Modbus RTU master over `Serial` (use `rs485_config` for RS485 direction control).
+
+    Config `MODBUS`: {'uart': Serial arguments, 'min_timeout': 0.05, 'max_timeout': 1.0, 'max_gap': 0}.
+    Responses complete as soon as their expected length arrived, or after a t3.5 idle gap, so the next request goes
+    out without waiting for a timeout. Due polls of one slave and function whose register ranges are adjacent (or
+    separated by at most `max_gap` registers, for slaves that allow reading unmapped registers) are merged into a
+    single request. If a slave answers a merged request with ILLEGAL DATA ADDRESS, its polls are read one by one
+    at once and are no longer merged for that slave and function.
+    """
+    ILLEGAL_DATA_ADDRESS = 2
+
+    class TimeoutError(Exception):
+        pass
+
+    class CrcError(Exception):
+        pass
+
+    class ResponseError(Exception):
+        pass
+
+    class ModbusException(Exception):
+
+        def __init__(self, function, code):
+            super().__init__('function {} exception code {}'.format(function, code))
+            self.function = function
+            self.code = code
+
+    def __init__(self, name, app=None, buffer_size=256):
+        self.serial = None
+        self.polls = []
+        self.slaves = {}
+        self.min_timeout = 0.05
+        self.max_timeout = 1.0
+        self.max_gap = 0
+        # (slave, function) whose polls must not be merged
+        self.unmergeable = set()
+        self.__gap_ms = 2
+        self.__buf = bytearray(buffer_size)
+        self.__view = memoryview(self.__buf)
+        self.__bus_lock = Lock()
+        self.__poll_cond = Condition()
+        self.__poll_thread = Thread(target=self.__poll_thread_worker)
+        super().__init__(name, app=app)
+
+    def init_app(self, app):
+        config = app.config['MODBUS']
+        uart = config['uart']
+        self.min_timeout = config.get('min_timeout', self.min_timeout)
+        self.max_timeout = config.get('max_timeout', self.max_timeout)
+        self.max_gap = config.get('max_gap', self.max_gap)
+        self.__gap_ms = idle_gap_ms(
+            uart.get('baudrate', 115200), uart.get('bytesize', 8), uart.get('parity', 0), uart.get('stopbits', 1)
+        )
+        self.serial = _Serial(**uart)
+        app.append_extension(self)
+
+    def load(self):
+        self.serial.open()
+        self.__poll_thread.start()
+
+    def slave_stats(self, slave):
+        stats = self.slaves.get(slave)
+        if stats is None:
+            stats = SlaveStats(self.min_timeout, self.max_timeout)
+            self.slaves[slave] = stats
+        return stats
+
+    def stats(self):
+        return {slave: stats.to_dict() for slave, stats in self.slaves.items()}
+
+    def add_poll(self, slave, address, count, function=3, interval=1.0, callback=None):
+        poll = Poll(slave, address, count, function=function, interval=interval, callback=callback)
+        with self.__poll_cond:
+            self.polls.append(poll)
+            self.__poll_cond.notify()
+        return poll
+
+    def remove_poll(self, poll):
+        with self.__poll_cond:
+            self.polls.remove(poll)
+
+    # ---- transactions ----
+
+    def __receive(self, expected, timeout):
+        """read one response into the receive buffer, complete at `expected` bytes, 5 bytes for an exception
+        response, or when the line stays idle for t3.5."""
+        size = 0
+        deadline = utime.ticks_add(utime.ticks_ms(), int(timeout * 1000))
+        while size < len(self.__buf):
+            if size == 0:
+                wait = utime.ticks_diff(deadline, utime.ticks_ms()) / 1000
+                if wait <= 0:
+                    raise self.TimeoutError('no response')
+            else:
+                wait = self.__gap_ms / 1000
+            try:
+                size += self.serial.readinto(self.__view[size:], timeout=wait)
+            except _Serial.TimeoutError:
+                if size == 0:
+                    raise self.TimeoutError('no response')
+                break
+            if size >= expected or (size >= 5 and self.__buf[1] & 0x80):
+                break
+        return size
+
+    def __discard_input(self):
+        while self.serial.uart.any():
+            self.serial.readinto(self.__buf, timeout=0)
+
+    def transact(self, slave, pdu, expected):
+        """send `pdu` to `slave`, returns the response PDU as a memoryview into the receive buffer, only valid until
+        the next transaction. `expected` is the full response frame size (address + PDU + CRC)."""
+        stats = self.slave_stats(slave)
+        frame = bytearray(len(pdu) + 3)
+        frame[0] = slave
+        frame[1:len(pdu) + 1] = pdu
+        crc = crc16(memoryview(frame)[:len(pdu) + 1])
+        frame[-2] = crc & 0xFF
+        frame[-1] = crc >> 8
+        with self.__bus_lock:
+            self.__discard_input()
+            stats.requests += 1
+            start = utime.ticks_ms()
+            self.serial.write(frame)
+            try:
+                size = self.__receive(expected, stats.timeout)
+            except self.TimeoutError:
+                stats.on_timeout()
+                raise
+            latency = utime.ticks_diff(utime.ticks_ms(), start) / 1000
+            # keep the t3.5 silent interval before the next request
+            utime.sleep_ms(self.__gap_ms)
+        view = self.__view[:size]
+        if size < 5 or crc16(view[:size - 2]) != view[size - 2] | (view[size - 1] << 8):
+            stats.crc_errors += 1
+            raise self.CrcError('bad crc from slave {}'.format(slave))
+        if view[0] != slave or view[1] & 0x7F != pdu[0]:
+            stats.mismatches += 1
+            raise self.ResponseError('unexpected response from slave {}'.format(view[0]))
+        stats.on_response(latency)
+        if view[1] & 0x80:
+            stats.exceptions += 1
+            raise self.ModbusException(pdu[0], view[2])
+        return view[1:size - 2]
+
+    def read(self, slave, address, count, function=3):
+        """read registers (function 3/4, list of int) or bits (function 1/2, list of bool)."""
+        pdu = bytes([function, address >> 8, address & 0xFF, count >> 8, count & 0xFF])
+        if function in (1, 2):
+            nbytes = (count + 7) // 8
+        else:
+            nbytes = count * 2
+        rv = self.transact(slave, pdu, nbytes + 5)
+        if rv[1] != nbytes or len(rv) < nbytes + 2:
+            self.slave_stats(slave).mismatches += 1
+            raise self.ResponseError('bad byte count from slave {}'.format(slave))
+        if function in (1, 2):
+            return [bool(rv[2 + i // 8] & (1 << (i % 8))) for i in range(count)]
+        return [(rv[2 + i * 2] << 8) | rv[3 + i * 2] for i in range(count)]
+
+    def read_holding_registers(self, slave, address, count):
+        return self.read(slave, address, count, function=3)
+
+    def read_input_registers(self, slave, address, count):
+        return self.read(slave, address, count, function=4)
+
+    def write_register(self, slave, address, value):
+        pdu = bytes([6, address >> 8, address & 0xFF, (value >> 8) & 0xFF, value & 0xFF])
+        self.transact(slave, pdu, 8)
+        return True
+
+    def write_registers(self, slave, address, values):
+        pdu = bytearray([16, address >> 8, address & 0xFF, len(values) >> 8, len(values) & 0xFF, len(values) * 2])
+        for value in values:
+            pdu.append((value >> 8) & 0xFF)
+            pdu.append(value & 0xFF)
+        self.transact(slave, pdu, 8)
+        return True
+
+    # ---- poll scheduler ----
+
+    def __merge(self, polls):
+        """group due polls into requests: [(slave, function, address, count, [polls])]."""
+        groups = {}
+        for poll in polls:
+            groups.setdefault((poll.slave, poll.function), []).append(poll)
+        requests = []
+        for (slave, function), items in groups.items():
+            if (slave, function) in self.unmergeable:
+                requests.extend([slave, function, poll.address, poll.count, [poll]] for poll in items)
+                continue
+            items.sort(key=lambda p: p.address)
+            current = None
+            for poll in items:
+                end = poll.address + poll.count
+                if current is not None and poll.address <= current[2] + current[3] + self.max_gap \
+                        and max(end, current[2] + current[3]) - current[2] <= _MAX_COUNT[function]:
+                    current[3] = max(end, current[2] + current[3]) - current[2]
+                    current[4].append(poll)
+                else:
+                    current = [slave, function, poll.address, poll.count, [poll]]
+                    requests.append(current)
+        return requests
+
+    def __run(self, request):
+        slave, function, address, count, polls = request
+        try:
+            values = self.read(slave, address, count, function=function)
+        except self.ModbusException as e:
+            if e.code != self.ILLEGAL_DATA_ADDRESS or len(polls) == 1:
+                self.__fail(request, e)
+                return
+            logger.warn('{} slave {} refused a merged read ({}), polls are read one by one from now on'.format(
+                self.name, slave, e))
+            self.unmergeable.add((slave, function))
+            for poll in polls:
+                self.__run([slave, function, poll.address, poll.count, [poll]])
+            return
+        except Exception as e:
+            self.__fail(request, e)
+            return
+        for poll in polls:
+            if poll.callback is None:
+                continue
+            offset = poll.address - address
+            try:
+                poll.callback(values[offset:offset + poll.count])
+            except Exception as e:
+                logger.error('{} poll callback error: {}'.format(poll, e))
+
+    def __fail(self, request, e):
+        slave, polls = request[0], request[4]
+        for poll in polls:
+            poll.errors += 1
+        logger.warn('{} poll slave {} failed: {}'.format(self.name, slave, e), key=slave)
+
+    def __poll_thread_worker(self):
+        while True:
+            with self.__poll_cond:
+                now = utime.ticks_ms()
+                due = [poll for poll in self.polls if utime.ticks_diff(poll.due, now) <= 0]
+                if not due:
+                    wait = None
+                    for poll in self.polls:
+                        remaining = utime.ticks_diff(poll.due, now) / 1000
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self.__poll_cond.wait(wait)
+                    continue
+                for poll in due:
+                    poll.due = utime.ticks_add(now, int(poll.interval * 1000))
+            for request in self.__merge(due):
+                self.__run(request)
@@ -0,0 +1,204 @@
+# Copyright (c) Quectel Wireless Solution, Co., Ltd.All Rights Reserved.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import utime
+from ..codecs import LengthPrefixDecoder
+from ..compression import Deflater, Inflater
+
+
+def _size_of(item):
+    if isinstance(item, (list, tuple)):
+        return sum([len(buf) for buf in item])
+    return len(item)
+
+
+class UplinkPipeline(object):
+    """What `TcpClient` does to messages between its outbox and the socket, and to received data before the codec:
+    length framing, aggregation of messages into batches and the compression envelope. The wire format is described
+    in docs/tcp_client.md."""
+
+    def __init__(self, deliver, aggregate=None, compression=None):
+        """
+        @deliver: called with the received data, out of its envelope with compression.
+        @aggregate: {'max_bytes': 1024, 'max_delay': 0.1, 'framing': None, 'length_size': 2}, None sends every
+        message on its own.
+        @compression: {'threshold': 64, 'dictionary': '', 'length_size': 2, 'max_size': 16384, 'max_chain': 8}, None
+        sends packets as they are.
+        """
+        self.deliver = deliver
+        self.aggregate_bytes = 0
+        self.aggregate_delay = 0
+        self.framing = None
+        self.length_size = 2
+        self.deflater = None
+        self.inflater = None
+        self.compress_threshold = 64
+        self.__agg_buf = None
+        self.__flush_pending = 0
+        self.__envelope = None
+        self.__compression_stats = {
+            'packets': 0, 'compressed': 0, 'bytes_in': 0, 'bytes_out': 0, 'rx_packets': 0, 'rx_compressed': 0,
+            'rx_bytes_in': 0, 'rx_bytes_out': 0,
+        }
+        self.__batch_stats = {
+            'batches': 0, 'messages': 0, 'payload_bytes': 0, 'wire_bytes': 0, 'by_size': 0, 'by_delay': 0,
+            'by_flush': 0,
+        }
+        if aggregate:
+            self.aggregate_bytes = aggregate.get('max_bytes', 1024)
+            self.aggregate_delay = aggregate.get('max_delay', 0.1)
+            self.framing = aggregate.get('framing')
+            self.length_size = aggregate.get('length_size', 2)
+            self.__agg_buf = bytearray(self.aggregate_bytes * 2)
+        if compression:
+            dictionary = compression.get('dictionary', b'')
+            if isinstance(dictionary, str):
+                dictionary = dictionary.encode()
+            self.deflater = Deflater(dictionary, max_chain=compression.get('max_chain', 8))
+            self.inflater = Inflater(dictionary)
+            self.compress_threshold = compression.get('threshold', 64)
+            self.__envelope = LengthPrefixDecoder(
+                length_size=compression.get('length_size', 2), max_size=compression.get('max_size', 16384),
+                initial_size=256
+            )
+
+    def reset(self):
+        """drop a received packet cut by the previous connection."""
+        if self.__envelope is not None:
+            self.__envelope.reset()
+
+    def feed(self, data):
+        if self.__envelope is not None:
+            self.__envelope.feed(data, self.__open_envelope)
+        else:
+            self.deliver(data)
+
+    def __open_envelope(self, frame):
+        header = self.__envelope.header_size
+        body = frame[header + 1:]
+        stats = self.__compression_stats
+        stats['rx_packets'] += 1
+        stats['rx_bytes_in'] += len(frame)
+        if frame[header] & 1:
+            body = self.inflater.decompress(body)
+            stats['rx_compressed'] += 1
+        stats['rx_bytes_out'] += len(body)
+        self.deliver(body)
+
+    def encode(self, data, framed=False):
+        """one packet as written to the socket: length prefix (unless `data` is an already `framed` batch) and
+        compression envelope, `data` itself or a list of buffers to send back to back."""
+        if self.framing == 'length' and not framed:
+            data = self.__frame(data)
+        if self.deflater is not None:
+            data = self.__wrap(data)
+        return data
+
+    def __frame(self, data):
+        """length prefix of one message as `pack` writes it."""
+        parts = list(data) if isinstance(data, (list, tuple)) else [data]
+        size = sum(len(part) for part in parts)
+        return [size.to_bytes(self.length_size, 'big')] + parts
+
+    def __wrap(self, data):
+        """compression envelope of one packet."""
+        if isinstance(data, (list, tuple)):
+            data = b''.join(data)
+        stats = self.__compression_stats
+        stats['packets'] += 1
+        stats['bytes_in'] += len(data)
+        flag = 0
+        if len(data) >= self.compress_threshold:
+            packed = self.deflater.compress(data)
+            if len(packed) < len(data):
+                data = packed
+                flag = 1
+                stats['compressed'] += 1
+        header = (len(data) + 1).to_bytes(self.__envelope.header_size, 'big') + bytes((flag,))
+        stats['bytes_out'] += len(header) + len(data)
+        return [header, data]
+
+    def compression_stats(self):
+        """envelope counters, `ratio` is bytes sent / bytes given (lower is better)."""
+        stats = dict(self.__compression_stats)
+        stats['ratio'] = stats['bytes_out'] / stats['bytes_in'] if stats['bytes_in'] else 1.0
+        return stats
+
+    def request_flush(self):
+        """close the batch as soon as the message just queued is in it."""
+        if self.aggregate_bytes:
+            self.__flush_pending += 1
+
+    def __framed_size(self, item):
+        size = _size_of(item)
+        return size + self.length_size if self.framing == 'length' else size
+
+    def collect(self, first, outbox):
+        """batch `first` with the messages queued in `outbox` until `max_bytes` is reached, `max_delay` passed or a
+        flush was requested, returns the messages and why the batch was closed."""
+        items = [first]
+        total = self.__framed_size(first)
+        deadline = utime.ticks_add(utime.ticks_ms(), int(self.aggregate_delay * 1000))
+        reason = 'by_size'
+        while total < self.aggregate_bytes:
+            if self.__flush_pending:
+                # a flush message is queued or in the batch: take what is queued and go
+                item = outbox.get(timeout=0)
+                if item is None:
+                    self.__flush_pending = 0
+                    reason = 'by_flush'
+                    break
+            else:
+                wait = utime.ticks_diff(deadline, utime.ticks_ms())
+                if wait <= 0:
+                    reason = 'by_delay'
+                    break
+                item = outbox.get(timeout=wait / 1000)
+                if item is None:
+                    continue
+            items.append(item)
+            total += self.__framed_size(item)
+        return items, reason
+
+    def pack(self, items):
+        """copy `items` (with their length headers in framed mode) into one buffer, returns a view of it."""
+        total = sum(self.__framed_size(item) for item in items)
+        buf = self.__agg_buf if total <= len(self.__agg_buf) else bytearray(total)
+        view = memoryview(buf)
+        pos = 0
+        for item in items:
+            parts = item if isinstance(item, (list, tuple)) else (item,)
+            if self.framing == 'length':
+                size = sum(len(part) for part in parts)
+                view[pos:pos + self.length_size] = size.to_bytes(self.length_size, 'big')
+                pos += self.length_size
+            for part in parts:
+                view[pos:pos + len(part)] = part
+                pos += len(part)
+        return view[:pos]
+
+    def count_batch(self, items, packet, reason):
+        """account a batch written as `packet`."""
+        stats = self.__batch_stats
+        stats['batches'] += 1
+        stats['messages'] += len(items)
+        stats['payload_bytes'] += sum(_size_of(item) for item in items)
+        stats['wire_bytes'] += len(packet)
+        stats[reason] += 1
+
+    def batch_stats(self):
+        """aggregation counters: batches (packets written), messages, bytes and why each batch was closed."""
+        stats = dict(self.__batch_stats)
+        stats['messages_per_batch'] = stats['messages'] / stats['batches'] if stats['batches'] else 0
+        return stats
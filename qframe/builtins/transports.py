@@ -0,0 +1,374 @@
+# Copyright (c) Quectel Wireless Solution, Co., Ltd.All Rights Reserved.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import utime
+import urandom
+from ..threading import Condition, Thread, Event
+from ..qsocket import rx_buffers
+from ..logging import getLogger
+
+
+logger = getLogger(__name__)
+
+
+class Transport(object):
+    """Keeps `sock` connected: passes every read to `on_data` and reconnects when the link is lost, backing off
+    exponentially from `reconnect_min` to `reconnect_max` seconds (each wait randomized by +/- `reconnect_jitter`).
+    While the data call is down (see `net_callback`) reconnecting pauses and it retries at once when it comes back.
+    """
+
+    def __init__(self, sock, on_data, on_connect=None, on_heartbeat=None, zero_copy=False, reconnect_min=1,
+                 reconnect_max=120, reconnect_factor=2, reconnect_jitter=0.5):
+        """
+        @on_data: called with the data of every read.
+        @on_connect: called once connected, before the first read.
+        @on_heartbeat: one heartbeat tick while connected, returns the delay (s) until the next one.
+        @zero_copy: read into a reused buffer and pass memoryview slices to `on_data`.
+        """
+        self.sock = sock
+        self.on_data = on_data
+        self.on_connect = on_connect
+        self.on_heartbeat = on_heartbeat
+        self.zero_copy = zero_copy
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.reconnect_factor = reconnect_factor
+        self.reconnect_jitter = reconnect_jitter
+        self._connected = Event()
+        self._net_up = Event()
+        self._net_up.set()
+        self.__stats = {'reconnects': 0, 'attempts': 0, 'last_ms': 0, 'max_ms': 0, 'total_ms': 0}
+
+    def __str__(self):
+        return str(self.sock)
+
+    def start(self):
+        raise NotImplementedError
+
+    def connect(self):
+        raise NotImplementedError
+
+    def lost(self):
+        """the link is dead (e.g. a write failed), reconnect."""
+        raise NotImplementedError
+
+    def net_callback(self, args):
+        """`network` extension callback, args[1]: 1 data call up, 0 down."""
+        raise NotImplementedError
+
+    def is_connected(self):
+        return self._connected.is_set()
+
+    def wait_connected(self):
+        self._connected.wait()
+
+    def disconnect(self):
+        logger.info('disconnect', self)
+        self._connected.clear()
+        try:
+            self.sock.disconnect()
+        except Exception as e:
+            logger.error('disconnect failed:', self, e)
+            return False
+        return True
+
+    def stats(self):
+        """reconnect counters, `*_ms` is the time from losing the link to being connected again."""
+        stats = self.__stats.copy()
+        stats['network_up'] = self._net_up.is_set()
+        return stats
+
+    def _opened(self):
+        if self.on_connect is not None:
+            self.on_connect()
+
+    def _attempt(self):
+        self.__stats['attempts'] += 1
+
+    def _reconnected(self, begin):
+        elapsed = utime.ticks_diff(utime.ticks_ms(), begin)
+        stats = self.__stats
+        stats['reconnects'] += 1
+        stats['last_ms'] = elapsed
+        stats['max_ms'] = max(stats['max_ms'], elapsed)
+        stats['total_ms'] += elapsed
+
+    def _backoff(self, delay):
+        jitter = delay * self.reconnect_jitter
+        return max(0, delay + urandom.uniform(-jitter, jitter))
+
+    def _receive(self, data):
+        try:
+            self.on_data(data)
+        except Exception as e:
+            logger.error('recv_callback error:', e)
+
+
+class ThreadedTransport(Transport):
+    """`Transport` with a listen thread blocking on reads, a reconnect thread and a heartbeat thread."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__retry_now = False
+        self.__rx_buf = None
+        self.__listen_thread = Thread(target=self.__listen_thread_worker)
+        self.__reconn_cond = Condition()
+        self.__reconn_thread = Thread(target=self.__reconn_thread_worker)
+        self.__heartbeat_thread = Thread(target=self.__heartbeat_thread_worker)
+
+    def start(self):
+        if self.on_heartbeat is not None:
+            self.__heartbeat_thread.start()
+        if not self.connect():
+            self.lost()
+
+    def connect(self):
+        logger.info('connecting...', self)
+        try:
+            self.sock.connect()
+        except Exception as e:
+            logger.error('connect failed:', self, e, key='connect')
+            return False
+        self._opened()
+        self.__listen_thread.start()
+        self._connected.set()
+        logger.info('connect successfully', self)
+        return True
+
+    def disconnect(self):
+        result = super().disconnect()
+        self.__listen_thread.stop()
+        self.__release_rx_buf()
+        return result
+
+    def __release_rx_buf(self):
+        buf, self.__rx_buf = self.__rx_buf, None
+        if buf is not None:
+            rx_buffers.put(buf)
+
+    def lost(self):
+        with self.__reconn_cond:
+            self._connected.clear()
+            self.__reconn_thread.start()
+            self.__reconn_cond.notify()
+
+    def net_callback(self, args):
+        with self.__reconn_cond:
+            if args[1] == 1:
+                self._net_up.set()
+                self.__retry_now = True
+            else:
+                self._net_up.clear()
+            self.__reconn_cond.notify_all()
+
+    def __listen_thread_worker(self):
+        buf = view = None
+        if self.zero_copy:
+            # owned by the transport so `disconnect` can give it back when it stops this thread
+            self.__release_rx_buf()
+            buf = self.__rx_buf = rx_buffers.get()
+            view = memoryview(buf)
+        while True:
+            try:
+                if buf is None:
+                    data = self.sock.read(1024)
+                else:
+                    data = view[:self.sock.readinto(buf)]
+            except self.sock.TimeoutError:
+                continue
+            except Exception as e:
+                logger.error('read error:', self, e, key='read')
+                data = None
+            if not data:
+                if data is not None:
+                    logger.error('read error: closed by peer', self, key='read')
+                if buf is not None and self.__rx_buf is buf:
+                    self.__release_rx_buf()
+                self.lost()
+                break
+            self._receive(data)
+
+    def __reconn_thread_worker(self):
+        with self.__reconn_cond:
+            begin = utime.ticks_ms()
+            self.disconnect()
+            delay = self.reconnect_min
+            while True:
+                if not self._net_up.is_set():
+                    logger.info('network down, reconnect paused', self)
+                    self.__reconn_cond.wait_for(self._net_up.is_set)
+                self.__retry_now = False
+                self._attempt()
+                if self.connect():
+                    break
+                self.disconnect()
+                if self.__reconn_cond.wait_for(lambda: self.__retry_now, timeout=self._backoff(delay)):
+                    # data call just came back, start over with a short backoff
+                    delay = self.reconnect_min
+                else:
+                    delay = min(delay * self.reconnect_factor, self.reconnect_max)
+            self._reconnected(begin)
+
+    def __heartbeat_thread_worker(self):
+        while True:
+            self._connected.wait()
+            utime.sleep_ms(max(1, int(self.on_heartbeat() * 1000)))
+
+
+class ReactorTransport(Transport):
+    """`Transport` without threads of its own: connecting, reading, reconnect backoff, heartbeat ticks and the
+    `idle_timeout` (s without received data before the link is considered dead) are handled by `reactor`, so
+    `on_data` runs on the reactor thread. Name resolution and the TLS handshake of every (re)connect also run on
+    that thread and hold up its other sockets meanwhile."""
+
+    def __init__(self, sock, on_data, reactor=None, idle_timeout=None, connect_timeout=30, **kwargs):
+        super().__init__(sock, on_data, **kwargs)
+        self.reactor = reactor
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.__rx_buf = None
+        self.__reconnecting = False
+        self.__reconn_begin = None
+        self.__reconn_delay = self.reconnect_min
+        self.__reconn_timer = None
+        self.__net_paused = False
+        self.__heartbeat_timer = None
+
+    def start(self):
+        if self.zero_copy:
+            self.__rx_buf = rx_buffers.get()
+        self.__reconnecting = True
+        self.__reconn_delay = self.reconnect_min
+        self.reactor.call_later(0, self.__connect)
+
+    def connect(self):
+        """connect at once, blocking the caller, then serve the socket from the reactor."""
+        logger.info('connecting...', self)
+        try:
+            self.sock.connect()
+        except Exception as e:
+            logger.error('connect failed:', self, e, key='connect')
+            return False
+        self.reactor.call_later(0, self.__on_connect, self.sock)
+        return True
+
+    def disconnect(self):
+        try:
+            self.reactor.unregister(self.sock)
+        except Exception as e:
+            logger.error('disconnect failed:', self, e)
+        return super().disconnect()
+
+    def lost(self):
+        self._connected.clear()
+        self.reactor.call_later(0, self.__lost)
+
+    def net_callback(self, args):
+        if args[1] == 1:
+            self._net_up.set()
+            self.reactor.call_later(0, self.__net_up)
+        else:
+            self._net_up.clear()
+
+    def __connect(self):
+        self.__reconn_timer = None
+        if not self._net_up.is_set():
+            # resumed by `__net_up`
+            self.__net_paused = True
+            logger.info('network down, reconnect paused', self)
+            return
+        logger.info('connecting...', self)
+        self._attempt()
+        self.reactor.connect(self.sock, self.__on_connect, self.__on_connect_error, timeout=self.connect_timeout)
+
+    def __on_connect(self, sock):
+        self._opened()
+        self.reactor.register(
+            sock, self.__on_readable, on_error=self.__on_error, idle_timeout=self.idle_timeout, on_idle=self.__on_idle
+        )
+        self.__reconnecting = False
+        self._connected.set()
+        if self.on_heartbeat is not None:
+            if self.__heartbeat_timer is not None:
+                self.reactor.cancel(self.__heartbeat_timer)
+            self.__heartbeat()
+        logger.info('connect successfully', self)
+        if self.__reconn_begin is not None:
+            self._reconnected(self.__reconn_begin)
+            self.__reconn_begin = None
+
+    def __on_connect_error(self, sock, error):
+        logger.error('connect failed:', self, error, key='connect')
+        if self.__reconn_begin is None:
+            self.__reconn_begin = utime.ticks_ms()
+        delay = self._backoff(self.__reconn_delay)
+        self.__reconn_delay = min(self.__reconn_delay * self.reconnect_factor, self.reconnect_max)
+        self.__reconn_timer = self.reactor.call_later(delay, self.__connect)
+
+    def __net_up(self):
+        if not self.__reconnecting:
+            return
+        if self.__net_paused:
+            self.__net_paused = False
+        elif self.__reconn_timer is not None:
+            # data call just came back, skip the backoff
+            self.reactor.cancel(self.__reconn_timer)
+        else:
+            # a connect is in flight
+            return
+        self.__reconn_delay = self.reconnect_min
+        self.__connect()
+
+    def __lost(self, error=None):
+        if self.__reconnecting:
+            return
+        if error is not None:
+            logger.error('read error:', self, error, key='read')
+        self.__reconnecting = True
+        self.__reconn_begin = utime.ticks_ms()
+        self.__reconn_delay = self.reconnect_min
+        self.disconnect()
+        self.__connect()
+
+    def __heartbeat(self):
+        self.__heartbeat_timer = None
+        if self._connected.is_set():
+            self.__heartbeat_timer = self.reactor.call_later(self.on_heartbeat(), self.__heartbeat)
+
+    def __on_error(self, sock, error):
+        self.__lost(error)
+
+    def __on_idle(self, sock):
+        self.__lost(OSError('no data for {}s'.format(self.idle_timeout)))
+
+    def __on_readable(self, sock):
+        raw = sock.sock
+        while True:
+            try:
+                if self.__rx_buf is None:
+                    data = sock.read(1024)
+                else:
+                    data = memoryview(self.__rx_buf)[:sock.readinto(self.__rx_buf)]
+            except sock.TimeoutError:
+                return
+            except Exception as e:
+                self.__lost(e)
+                return
+            if not data:
+                self.__lost(OSError('closed by peer'))
+                return
+            self._receive(data)
+            # TLS may hold decrypted data the socket poll does not see
+            if not (hasattr(raw, 'pending') and raw.pending()):
+                return
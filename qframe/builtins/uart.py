@@ -13,44 +13,258 @@
 # limitations under the License.
 
 from .. import AppExtensionABC
-from ..threading import Thread
-from ..serial import Serial as _Serial
+from ..threading import Thread, MpscSignal, ThreadPoolExecutor
+from ..collections import OrderedDict
+from ..serial import Serial as _Serial, rx_buffers
 from ..logging import getLogger
 
 logger = getLogger(__name__)
 
 
 class Uart(AppExtensionABC):
+    PAUSE = 'pause'
+    DROP = 'drop'
 
-    def __init__(self, name, app=None):
+    def __init__(self, name, app=None, decoder=None, zero_copy=False, backpressure=None, policy=PAUSE):
+        """
+        @decoder: optional `qframe.serial.FrameDecoder`, `recv_callback` then receives whole frames.
+        @zero_copy: read into a reused buffer and pass memoryview slices to `recv_callback` (or the decoder).
+        The memoryview is only valid until the callback returns.
+        @backpressure: `qframe.threading.Backpressure` of the consumer of the received data, or the name of an
+        extension exposing one as `backpressure` (e.g. a `TcpClient` with the 'backpressure' option).
+        @policy: what to do while the consumer is paused. 'pause' stops reading: the UART RX buffer fills up and,
+        with `flowctl` enabled, the UART deasserts RTS so the device stops sending; without flow control the device
+        data overflows the RX buffer. 'drop' keeps reading and discards the data (counted in `flow_stats`). A
+        callable is called from the listen thread with True on pause and False on resume, e.g. to send XOFF/XON,
+        and returns True to also stop reading.
+        """
         self.serial = None
         self.write = None
         self.read = None
         self.listen_thread = None
+        self.decoder = decoder
+        self.zero_copy = zero_copy
+        self.backpressure = backpressure
+        self.policy = policy
+        self.flowctl = 0
+        self.dropped_bytes = 0
+        self.__paused = False
+        self.__hold = False
+        self.__app = None
         super().__init__(name, app=app)
 
     def init_app(self, app):
+        self.__app = app
         self.serial = _Serial(**app.config['UART'])
+        self.flowctl = app.config['UART'].get('flowctl', 0)
         self.write = self.serial.write
         self.read = self.serial.read
         self.listen_thread = Thread(target=self.listen_thread_worker)
         app.append_extension(self)
 
     def load(self):
+        if isinstance(self.backpressure, str):
+            self.backpressure = self.__app.extensions[self.backpressure].backpressure
+        if self.backpressure is not None and self.policy == self.PAUSE and not self.flowctl:
+            logger.warn('{} pauses reads without flowctl, data sent meanwhile may overflow the RX buffer.'.format(
+                self.name))
         self.serial.open()
         self.listen_thread.start()
 
+    def __flow_control(self):
+        """follow the consumer state, returns True while reading is held."""
+        paused = self.backpressure.is_paused()
+        if paused != self.__paused:
+            self.__paused = paused
+            if self.policy == self.PAUSE:
+                self.__hold = paused
+            elif self.policy == self.DROP:
+                self.__hold = False
+            else:
+                try:
+                    self.__hold = bool(self.policy(paused)) and paused
+                except Exception as e:
+                    logger.error('backpressure policy error:', e)
+                    self.__hold = False
+        if self.__hold:
+            # leave the bytes in the UART, RTS holds the device back with flow control
+            self.backpressure.wait(timeout=1)
+        return self.__hold
+
+    def flow_stats(self):
+        if self.backpressure is None or isinstance(self.backpressure, str):
+            return None
+        stats = self.backpressure.stats()
+        stats['holding'] = self.__hold
+        stats['dropped_bytes'] = self.dropped_bytes
+        return stats
+
     def listen_thread_worker(self):
+        buf = view = None
+        if self.zero_copy:
+            buf = rx_buffers.get()
+            view = memoryview(buf)
         while True:
+            if self.backpressure is not None and self.__flow_control():
+                continue
+            decoder = self.decoder
             try:
-                data = self.read(1024)
+                if buf is None:
+                    data = self.read(1024, timeout=decoder.timeout if decoder else None)
+                else:
+                    data = view[:self.serial.readinto(buf, timeout=decoder.timeout if decoder else None)]
+            except _Serial.TimeoutError:
+                decoder.expire(self.__dispatch)
             except Exception as e:
-                logger.error('serial read error: {}'.format(e))
+                logger.error('serial read error:', e, key='read')
             else:
-                try:
-                    self.recv_callback(data)
-                except Exception as e:
-                    logger.error('recv_callback error: {}'.format(e))
+                if self.__paused and self.policy == self.DROP:
+                    self.dropped_bytes += len(data)
+                    if decoder is not None:
+                        decoder.reset()
+                elif decoder is None:
+                    self.__dispatch(data)
+                else:
+                    decoder.feed(data, self.__dispatch)
+
+    def __dispatch(self, data):
+        try:
+            self.recv_callback(data)
+        except Exception as e:
+            logger.error('recv_callback error:', e)
 
     def recv_callback(self, data):
         raise NotImplementedError('you must implement this method to handle data received from device.')
+
+
+class SerialPort(object):
+    """One port of a `SerialMux` with its own decoder, handler and statistics."""
+
+    def __init__(self, name, serial, decoder=None, handler=None):
+        self.name = name
+        self.serial = serial
+        self.decoder = decoder
+        self.handler = handler
+        self.rx_bytes = 0
+        self.rx_frames = 0
+        self.errors = 0
+        self.throttled = 0
+
+    def stats(self):
+        return {
+            'rx_bytes': self.rx_bytes,
+            'rx_frames': self.rx_frames,
+            'errors': self.errors,
+            'throttled': self.throttled,
+            'overflows': self.decoder.overflows if self.decoder else 0,
+        }
+
+
+class SerialMux(AppExtensionABC):
+    """Several serial ports serviced by a single thread.
+
+    Ports are read from config `SERIAL_MUX`, a dict of port name to `Serial` arguments. All ports post one shared
+    signal from their RX callbacks; the service thread drains every port per wakeup and dispatches data (or whole
+    frames when the port has a decoder) to the port handler, falling back to `recv_callback(port_name, data)`.
+    With `use_executor=True` dispatch goes through the app thread pool instead of the service thread, tasks are named
+    '<extension name>.<port name>' so a port can be capped with `app.business_threads_pool.set_rate_limit`; data
+    refused by the limit is dropped and counted in the port `throttled` statistic.
+    """
+
+    def __init__(self, name, app=None, use_executor=False, buffer_size=1024):
+        self.ports = OrderedDict()
+        self.use_executor = use_executor
+        self.__app = None
+        # RX callbacks of every port post this one signal
+        self.__signal = MpscSignal()
+        self.__buf = bytearray(buffer_size)
+        self.__view = memoryview(self.__buf)
+        self.__service_thread = Thread(target=self.__service_thread_worker)
+        super().__init__(name, app=app)
+
+    def init_app(self, app):
+        self.__app = app
+        for port_name, config in app.config.get('SERIAL_MUX', {}).items():
+            self.add_port(port_name, **config)
+        app.append_extension(self)
+
+    def load(self):
+        for port in self.ports.values():
+            port.serial.open()
+        self.__service_thread.start()
+
+    def add_port(self, port_name, decoder=None, handler=None, **config):
+        serial = _Serial(rx_signal=self.__signal, **config)
+        self.ports[port_name] = SerialPort(port_name, serial, decoder=decoder, handler=handler)
+        return self.ports[port_name]
+
+    def set_decoder(self, port_name, decoder):
+        self.ports[port_name].decoder = decoder
+
+    def register(self, port_name):
+        """decorator registering the handler of `port_name`, called with the received data or frame."""
+        def wrapper(fn):
+            self.ports[port_name].handler = fn
+            return fn
+        return wrapper
+
+    def write(self, port_name, data, **kwargs):
+        return self.ports[port_name].serial.write(data, **kwargs)
+
+    def stats(self):
+        return {port.name: port.stats() for port in self.ports.values()}
+
+    def recv_callback(self, port_name, data):
+        raise NotImplementedError('register a port handler or implement this method to handle data from ports.')
+
+    def __handle(self, port, data):
+        try:
+            if port.handler is not None:
+                port.handler(data)
+            else:
+                self.recv_callback(port.name, data)
+        except Exception as e:
+            port.errors += 1
+            logger.error('port handler error:', self.name, port.name, e)
+
+    def __dispatch(self, port, data):
+        port.rx_frames += 1
+        if self.use_executor:
+            # the service buffer is reused, tasks must own their data
+            if isinstance(data, memoryview):
+                data = bytes(data)
+            try:
+                self.__app.submit(target=self.__handle, args=(port, data), name='{}.{}'.format(self.name, port.name))
+            except ThreadPoolExecutor.Throttled:
+                port.throttled += 1
+        else:
+            self.__handle(port, data)
+
+    def __drain(self, port):
+        while True:
+            try:
+                size = port.serial.readinto(self.__buf, timeout=0)
+            except _Serial.TimeoutError:
+                break
+            except Exception as e:
+                port.errors += 1
+                logger.error('port read error:', self.name, port.name, e, key=port.name)
+                break
+            port.rx_bytes += size
+            data = self.__view[:size]
+            if port.decoder is None:
+                self.__dispatch(port, data)
+            else:
+                port.decoder.feed(data, lambda frame: self.__dispatch(port, frame))
+
+    def __service_thread_worker(self):
+        while True:
+            timeout = None
+            for port in self.ports.values():
+                if port.decoder is not None and port.decoder.timeout is not None:
+                    timeout = port.decoder.timeout if timeout is None else min(timeout, port.decoder.timeout)
+            self.__signal.wait(timeout)
+            for port in self.ports.values():
+                self.__drain(port)
+                if port.decoder is not None and port.decoder.timeout is not None:
+                    port.decoder.expire(lambda frame: self.__dispatch(port, frame))
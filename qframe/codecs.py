@@ -0,0 +1,302 @@
+# Copyright (c) Quectel Wireless Solution, Co., Ltd.All Rights Reserved.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+class FrameDecoder(object):
+    """Base class of streaming frame decoders.
+
+    Fragments passed to `feed` are reassembled in a reused buffer and every complete frame is passed to
+    `callback`. Frames found whole inside one fragment are delivered without touching the reassembly buffer.
+    With `copy=False` the callback gets a memoryview which is only valid until the callback returns.
+    The buffer starts at `initial_size` (default `max_size`) and doubles as needed up to `max_size`, so a large
+    limit does not cost memory until such frames arrive.
+    """
+
+    def __init__(self, max_size=1024, copy=True, initial_size=None):
+        self.max_size = max_size
+        self.copy = copy
+        self.buffer = bytearray(min(initial_size or max_size, max_size))
+        self.view = memoryview(self.buffer)
+        self.size = 0
+        self.frames = 0
+        self.overflows = 0
+
+    @property
+    def timeout(self):
+        """read timeout (s) the reader should use, `expire` is called once it elapses. None for blocking reads."""
+        return None
+
+    def reset(self):
+        self.size = 0
+
+    def _capacity(self):
+        """most bytes the reassembly buffer may hold."""
+        return self.max_size
+
+    def _append(self, view):
+        """copy `view` into the reassembly buffer, returns False if it does not fit."""
+        end = self.size + len(view)
+        if end > self._capacity():
+            return False
+        if end > len(self.buffer):
+            self.__grow(end)
+        self.view[self.size:end] = view
+        self.size = end
+        return True
+
+    def __grow(self, size):
+        capacity = len(self.buffer) or 1
+        while capacity < size:
+            capacity *= 2
+        buffer = bytearray(min(capacity, self._capacity()))
+        buffer[:self.size] = self.view[:self.size]
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+
+    def _deliver(self, callback, view):
+        self.frames += 1
+        callback(bytes(view) if self.copy else view)
+
+    def feed(self, data, callback):
+        """feed received bytes, returns the number of frames delivered."""
+        raise NotImplementedError
+
+    def expire(self, callback):
+        """called by the reader when `timeout` elapsed without new data, returns the number of frames delivered."""
+        return 0
+
+
+class SizedFrameDecoder(FrameDecoder):
+    """Base class of decoders whose frame size can be known from the first `header_size` bytes."""
+    header_size = 1
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__skip = 0
+
+    def reset(self):
+        super().reset()
+        self.__skip = 0
+
+    def frame_size(self, view, start, end):
+        """total size of the frame beginning at `view[start]`, only called with at least `header_size` bytes."""
+        raise NotImplementedError
+
+    def feed(self, data, callback):
+        view = memoryview(data)
+        pos, end = 0, len(view)
+        count = 0
+        while pos < end:
+            if self.__skip:
+                # drop the rest of an oversized frame
+                n = min(self.__skip, end - pos)
+                self.__skip -= n
+                pos += n
+                continue
+            if self.size == 0 and end - pos >= self.header_size:
+                total = self.frame_size(view, pos, end)
+                if total > self.max_size:
+                    self.overflows += 1
+                    self.__skip = total
+                    continue
+                if total <= end - pos:
+                    self._deliver(callback, view[pos:pos + total])
+                    pos += total
+                    count += 1
+                    continue
+            if self.size < self.header_size:
+                n = min(self.header_size - self.size, end - pos)
+                self._append(view[pos:pos + n])
+                pos += n
+                if self.size < self.header_size:
+                    break
+            total = self.frame_size(self.view, 0, self.size)
+            if total > self.max_size:
+                self.overflows += 1
+                self.__skip = total - self.size
+                self.size = 0
+                continue
+            n = min(total - self.size, end - pos)
+            self._append(view[pos:pos + n])
+            pos += n
+            if self.size == total:
+                self._deliver(callback, self.view[:total])
+                self.size = 0
+                count += 1
+        return count
+
+
+class FixedSizeDecoder(SizedFrameDecoder):
+
+    def __init__(self, frame_size, copy=True):
+        super().__init__(max_size=frame_size, copy=copy)
+        self.header_size = frame_size
+
+    def frame_size(self, view, start, end):
+        return self.header_size
+
+
+class LengthPrefixDecoder(SizedFrameDecoder):
+    """Frames carrying their length in a header field.
+
+    @offset: offset of the length field in the frame.
+    @length_size: size of the length field (1/2/4 bytes).
+    @byteorder: 'big' or 'little'.
+    @adjust: added to the field value to get the total frame size, e.g. `offset + length_size` when the field only
+    counts the payload following it.
+    """
+
+    def __init__(self, offset=0, length_size=2, byteorder='big', adjust=None, max_size=1024, copy=True,
+                 initial_size=None):
+        super().__init__(max_size=max_size, copy=copy, initial_size=initial_size)
+        self.offset = offset
+        self.length_size = length_size
+        self.byteorder = byteorder
+        self.adjust = offset + length_size if adjust is None else adjust
+        self.header_size = offset + length_size
+
+    def frame_size(self, view, start, end):
+        start += self.offset
+        length = int.from_bytes(bytes(view[start:start + self.length_size]), self.byteorder)
+        return max(length + self.adjust, self.header_size)
+
+
+class DelimiterDecoder(FrameDecoder):
+    """Frames terminated by `delimiter`, which is stripped from delivered frames unless `strip` is False."""
+
+    def __init__(self, delimiter=b'\r\n', strip=True, max_size=1024, copy=True, initial_size=None):
+        super().__init__(max_size=max_size, copy=copy, initial_size=initial_size)
+        self.delimiter = delimiter
+        self.strip = strip
+        self.__discard = False
+        # last bytes of discarded data, a delimiter may start there and end in the next fragment
+        self.__tail = b''
+
+    def reset(self):
+        super().reset()
+        self.__discard = False
+        self.__tail = b''
+
+    def _capacity(self):
+        # a stripped frame of `max_size` bytes may be followed by the head of a delimiter split across fragments
+        return self.max_size + (len(self.delimiter) - 1 if self.strip else 0)
+
+    def __start_discard(self, data):
+        """drop the buffered frame and `data` (its continuation) up to the next delimiter."""
+        keep = len(self.delimiter) - 1
+        if keep:
+            self.__tail = (bytes(self.view[max(0, self.size - keep):self.size]) + data)[-keep:]
+        self.overflows += 1
+        self.__discard = True
+        self.size = 0
+
+    def __keep_tail(self, data):
+        keep = len(self.delimiter) - 1
+        if keep:
+            self.__tail = (self.__tail + data)[-keep:]
+
+    def __resync(self, data):
+        """end the discarded frame if a delimiter spans the previous fragment and `data`, returns the bytes of
+        `data` it used, else 0."""
+        tail = self.__tail
+        if not tail:
+            return 0
+        index = (tail + data[:len(self.delimiter) - 1]).find(self.delimiter)
+        if index < 0:
+            return 0
+        self.__discard = False
+        self.__tail = b''
+        return index + len(self.delimiter) - len(tail)
+
+    def __split_delimiter(self, data):
+        """length of the delimiter head held at the end of the buffer when `data` starts with its tail, else 0."""
+        for k in range(min(len(self.delimiter) - 1, self.size), 0, -1):
+            if data[:len(self.delimiter) - k] == self.delimiter[k:] and \
+                    bytes(self.view[self.size - k:self.size]) == self.delimiter[:k]:
+                return k
+        return 0
+
+    def __complete(self, callback):
+        """end the buffered frame, returns True if it was delivered."""
+        delivered = False
+        if self.__discard:
+            self.__discard = False
+            self.__tail = b''
+        elif self.size > self.max_size:
+            self.overflows += 1
+        else:
+            self._deliver(callback, self.view[:self.size])
+            delivered = True
+        self.size = 0
+        return delivered
+
+    def feed(self, data, callback):
+        # searching needs `bytes.find`, memoryview/bytearray fragments are copied once here.
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        view = memoryview(data)
+        dlen = len(self.delimiter)
+        pos, end = 0, len(data)
+        count = 0
+        if self.__discard and dlen > 1:
+            pos = self.__resync(data)
+        elif self.size and dlen > 1:
+            k = self.__split_delimiter(data)
+            if k:
+                if self.strip:
+                    self.size -= k
+                elif not self._append(view[:dlen - k]):
+                    self.__start_discard(b'')
+                if self.__complete(callback):
+                    count += 1
+                pos = dlen - k
+        while pos < end:
+            index = data.find(self.delimiter, pos)
+            if index < 0:
+                if self.__discard:
+                    self.__keep_tail(data[pos:end])
+                elif not self._append(view[pos:end]):
+                    self.__start_discard(data[pos:end])
+                break
+            stop = index if self.strip else index + dlen
+            if self.size == 0 and not self.__discard:
+                if stop - pos <= self.max_size:
+                    self._deliver(callback, view[pos:stop])
+                    count += 1
+                else:
+                    self.overflows += 1
+            elif self.__discard or not self._append(view[pos:stop]):
+                if not self.__discard:
+                    self.overflows += 1
+                self.__discard = False
+                self.__tail = b''
+                self.size = 0
+            elif self.__complete(callback):
+                count += 1
+            pos = index + dlen
+        return count
+
+
+def make_decoder(type='length', **kwargs):
+    """decoder from plain config, `type` is 'length' (`LengthPrefixDecoder`), 'delimiter' (`DelimiterDecoder`, a
+    str delimiter is encoded) or 'fixed' (`FixedSizeDecoder`), other keys are passed to the decoder."""
+    if type == 'length':
+        return LengthPrefixDecoder(**kwargs)
+    if type == 'delimiter':
+        if isinstance(kwargs.get('delimiter'), str):
+            kwargs['delimiter'] = kwargs['delimiter'].encode()
+        return DelimiterDecoder(**kwargs)
+    if type == 'fixed':
+        return FixedSizeDecoder(**kwargs)
+    raise ValueError('unknown decoder type \"{}\".'.format(type))
@@ -12,8 +12,36 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import uos
 import ql_fs
+import ustruct
 import _thread
+import ubinascii
+from .logging import getLogger
+
+
+logger = getLogger(__name__)
+
+
+_CRC32_TABLE = []
+
+
+def _soft_crc32(data, crc=0):
+    """table driven CRC-32 (IEEE 802.3), same result as `binascii.crc32`."""
+    if not _CRC32_TABLE:
+        for n in range(256):
+            c = n
+            for _ in range(8):
+                c = (c >> 1) ^ 0xEDB88320 if c & 1 else c >> 1
+            _CRC32_TABLE.append(c)
+    crc ^= 0xFFFFFFFF
+    for b in data:
+        crc = _CRC32_TABLE[(crc ^ b) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+# not every firmware build ships `ubinascii.crc32`
+_crc32 = getattr(ubinascii, 'crc32', None) or _soft_crc32
 
 
 class Singleton(object):
@@ -110,6 +138,361 @@ class OrderedDict(object):
             self[k] = v
 
 
+class BufferPool(object):
+    """Pool of reusable `bytearray` buffers of `size` bytes.
+
+    Buffers are allocated on first use, so an unused pool costs no memory. `get` falls back to a fresh allocation
+    once `count` buffers are out (counted in `misses`), `put` gives a buffer back for reuse. At most `count` buffers
+    are kept.
+    """
+
+    def __init__(self, size=1024, count=2):
+        self.size = size
+        self.count = count
+        self.misses = 0
+        self.__free = []
+        self.__created = 0
+        self.__lock = _thread.allocate_lock()
+
+    def get(self):
+        with self.__lock:
+            if self.__free:
+                return self.__free.pop()
+            if self.__created < self.count:
+                self.__created += 1
+            else:
+                self.misses += 1
+        return bytearray(self.size)
+
+    def put(self, buf):
+        if len(buf) != self.size:
+            raise ValueError('buffer size should be {}.'.format(self.size))
+        with self.__lock:
+            if len(self.__free) < self.count:
+                self.__free.append(buf)
+
+    def available(self):
+        """buffers `get` can hand out without a miss."""
+        with self.__lock:
+            return len(self.__free) + self.count - self.__created
+
+
+class RingBuffer(object):
+    """Bounded byte ring buffer. Not thread safe, callers serialize access."""
+
+    def __init__(self, capacity):
+        if capacity <= 0:
+            raise ValueError('capacity must be greater than 0.')
+        self.capacity = capacity
+        self.__buf = bytearray(capacity)
+        self.__view = memoryview(self.__buf)
+        self.__head = 0
+        self.__size = 0
+
+    def __len__(self):
+        return self.__size
+
+    def free(self):
+        return self.capacity - self.__size
+
+    def clear(self):
+        self.__head = 0
+        self.__size = 0
+
+    def write(self, data):
+        """copy as much of `data` as fits, returns the number of bytes copied."""
+        view = memoryview(data)
+        total = min(len(view), self.capacity - self.__size)
+        written = 0
+        while written < total:
+            tail = (self.__head + self.__size) % self.capacity
+            n = min(total - written, self.capacity - tail)
+            self.__view[tail:tail + n] = view[written:written + n]
+            self.__size += n
+            written += n
+        return written
+
+    def peek(self):
+        """memoryview of the contiguous readable region at the head, valid until `consume` or `clear`."""
+        return self.__view[self.__head:min(self.__head + self.__size, self.capacity)]
+
+    def consume(self, n):
+        n = min(n, self.__size)
+        self.__head = (self.__head + n) % self.capacity
+        self.__size -= n
+        if self.__size == 0:
+            # restart at the buffer start so the next peek is as large as possible
+            self.__head = 0
+        return n
+
+
+class PersistentQueue(object):
+    """FIFO of byte records persisted on flash in append-only segment files.
+
+    Layout under `path`: segments `<id>.seg` holding records `magic(1) | length(2) | crc32(4) | payload`, and a
+    `cursor` checkpoint (read segment id and offset). Segments are rotated at `segment_size` bytes and deleted once
+    fully read; beyond `max_segments` the oldest segment is dropped. The cursor is written every
+    `checkpoint_every` acks, so after a power loss at most that many records are delivered again. A torn or
+    corrupt record is detected by the CRC, logged and skipped: reading resumes at the next valid record header.
+    """
+    MAGIC = 0xA5
+    HEADER_FORMAT = '>BHI'
+    HEADER_SIZE = 7
+
+    def __init__(self, path, segment_size=32768, max_segments=16, checkpoint_every=8):
+        self.path = path.rstrip('/')
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.checkpoint_every = checkpoint_every
+        self.dropped_segments = 0
+        self.corrupt_records = 0
+        self.__corrupt_seen = set()
+        self.__lock = _thread.allocate_lock()
+        self.__segments = []
+        self.__read_seg = 0
+        self.__read_off = 0
+        self.__reader = None
+        self.__writer = None
+        self.__write_size = 0
+        self.__pending = 0
+        self.__unsaved = 0
+        self.__head = None
+        self.__open()
+
+    def __seg_path(self, seg):
+        return '{}/{:08d}.seg'.format(self.path, seg)
+
+    def __cursor_path(self):
+        return '{}/cursor'.format(self.path)
+
+    def __read_record(self, f):
+        """returns payload, None at a clean end, raises ValueError on a torn or corrupt record."""
+        header = f.read(self.HEADER_SIZE)
+        if not header:
+            return None
+        if len(header) < self.HEADER_SIZE:
+            raise ValueError('torn header')
+        magic, length, crc = ustruct.unpack(self.HEADER_FORMAT, header)
+        if magic != self.MAGIC:
+            raise ValueError('bad magic')
+        payload = f.read(length)
+        if len(payload) < length or _crc32(payload) & 0xFFFFFFFF != crc:
+            raise ValueError('bad crc')
+        return payload
+
+    def __resync(self, f, start):
+        """offset of the first valid record after the corrupt one at `start`, None if none follows. `f` is left
+        positioned at the returned offset."""
+        offset = start + 1
+        while True:
+            f.seek(offset)
+            chunk = f.read(512)
+            if not chunk:
+                return None
+            index = chunk.find(bytes([self.MAGIC]))
+            if index < 0:
+                offset += len(chunk)
+                continue
+            offset += index
+            f.seek(offset)
+            try:
+                if self.__read_record(f) is not None:
+                    f.seek(offset)
+                    return offset
+            except ValueError:
+                pass
+            offset += 1
+
+    def __skip_corrupt(self, f, seg, start, error):
+        """count and log the corrupt record at `start` (once, it is seen again when reading after counting on open),
+        move `f` to the next valid one, returns whether found."""
+        offset = self.__resync(f, start)
+        if (seg, start) in self.__corrupt_seen:
+            return offset is not None
+        self.__corrupt_seen.add((seg, start))
+        self.corrupt_records += 1
+        if offset is None:
+            logger.warn('segment {} corrupt at {} ({}), dropping the rest of it'.format(seg, start, error))
+            return False
+        logger.warn('segment {} corrupt at {} ({}), skipped {} bytes'.format(seg, start, error, offset - start))
+        return True
+
+    def __count(self, seg, offset):
+        """number of valid records in `seg` from `offset` and the offset where they end."""
+        count = 0
+        with open(self.__seg_path(seg), 'rb') as f:
+            f.seek(offset)
+            while True:
+                start = f.tell()
+                try:
+                    if self.__read_record(f) is None:
+                        break
+                except ValueError as e:
+                    if not self.__skip_corrupt(f, seg, start, e):
+                        break
+                    continue
+                count += 1
+                offset = f.tell()
+        return count, offset
+
+    def __open(self):
+        if not ql_fs.path_exists(self.path):
+            ql_fs.mkdirs(self.path)
+        self.__segments = sorted([int(name[:-4]) for name in uos.listdir(self.path) if name.endswith('.seg')])
+        seg, offset = 0, 0
+        try:
+            with open(self.__cursor_path(), 'rb') as f:
+                seg, offset, crc = ustruct.unpack('>III', f.read(12))
+            if _crc32(ustruct.pack('>II', seg, offset)) & 0xFFFFFFFF != crc:
+                seg, offset = 0, 0
+        except Exception:
+            pass
+        # segments before the checkpoint were fully read but not deleted yet
+        for old in [s for s in self.__segments if s < seg]:
+            self.__remove(old)
+        if not self.__segments or self.__segments[0] != seg:
+            offset = 0
+        self.__read_seg = self.__segments[0] if self.__segments else seg
+        self.__read_off = offset
+        self.__pending = 0
+        end = 0
+        for s in self.__segments:
+            count, end = self.__count(s, offset if s == self.__read_seg else 0)
+            self.__pending += count
+        if self.__segments:
+            size = uos.stat(self.__seg_path(self.__segments[-1]))[6]
+            if end != size or size >= self.segment_size:
+                # never append behind a torn tail
+                self.__rotate()
+            else:
+                self.__writer = open(self.__seg_path(self.__segments[-1]), 'ab')
+                self.__write_size = size
+        else:
+            self.__segments.append(self.__read_seg)
+            self.__writer = open(self.__seg_path(self.__read_seg), 'ab')
+            self.__write_size = 0
+
+    def __remove(self, seg):
+        try:
+            uos.remove(self.__seg_path(seg))
+        except OSError:
+            pass
+        if seg in self.__segments:
+            self.__segments.remove(seg)
+        self.__corrupt_seen = set(item for item in self.__corrupt_seen if item[0] != seg)
+
+    def __rotate(self):
+        if self.__writer is not None:
+            self.__writer.close()
+        seg = self.__segments[-1] + 1 if self.__segments else 0
+        self.__segments.append(seg)
+        self.__writer = open(self.__seg_path(seg), 'ab')
+        self.__write_size = 0
+        while len(self.__segments) > self.max_segments:
+            self.__drop_oldest()
+
+    def __drop_oldest(self):
+        seg = self.__segments[0]
+        count, _ = self.__count(seg, self.__read_off)
+        self.__pending -= count
+        self.dropped_segments += 1
+        self.__close_reader()
+        self.__remove(seg)
+        self.__read_seg = self.__segments[0]
+        self.__read_off = 0
+        self.__head = None
+        self.__save_cursor()
+
+    def __close_reader(self):
+        if self.__reader is not None:
+            self.__reader.close()
+            self.__reader = None
+
+    def __save_cursor(self):
+        data = ustruct.pack('>II', self.__read_seg, self.__read_off)
+        tmp = self.__cursor_path() + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data + ustruct.pack('>I', _crc32(data) & 0xFFFFFFFF))
+        uos.rename(tmp, self.__cursor_path())
+        self.__unsaved = 0
+
+    def __len__(self):
+        with self.__lock:
+            return self.__pending
+
+    def put(self, data):
+        data = bytes(data)
+        if len(data) > 0xFFFF:
+            raise ValueError('record too large.')
+        record = ustruct.pack(
+            self.HEADER_FORMAT, self.MAGIC, len(data), _crc32(data) & 0xFFFFFFFF
+        ) + data
+        with self.__lock:
+            if self.__write_size and self.__write_size + len(record) > self.segment_size:
+                self.__rotate()
+            self.__writer.write(record)
+            self.__writer.flush()
+            self.__write_size += len(record)
+            self.__pending += 1
+        return True
+
+    def peek(self):
+        """oldest record without removing it, None when empty."""
+        with self.__lock:
+            while self.__head is None and self.__pending > 0:
+                if self.__reader is None:
+                    self.__reader = open(self.__seg_path(self.__read_seg), 'rb')
+                    self.__reader.seek(self.__read_off)
+                start = self.__reader.tell()
+                try:
+                    payload = self.__read_record(self.__reader)
+                except ValueError as e:
+                    if self.__skip_corrupt(self.__reader, self.__read_seg, start, e):
+                        continue
+                    payload = None
+                if payload is not None:
+                    self.__head = (payload, self.__reader.tell())
+                elif self.__read_seg != self.__segments[-1]:
+                    # segment exhausted (or corrupt tail), move on
+                    self.__close_reader()
+                    self.__remove(self.__read_seg)
+                    self.__read_seg = self.__segments[0]
+                    self.__read_off = 0
+                    self.__save_cursor()
+                else:
+                    # nothing readable left in the write segment
+                    self.__close_reader()
+                    self.__pending = 0
+            return self.__head[0] if self.__head is not None else None
+
+    def ack(self):
+        """remove the record returned by the last `peek`."""
+        with self.__lock:
+            if self.__head is None:
+                return
+            self.__read_off = self.__head[1]
+            self.__head = None
+            self.__pending -= 1
+            self.__unsaved += 1
+            if self.__unsaved >= self.checkpoint_every or self.__pending == 0:
+                self.__save_cursor()
+
+    def get(self):
+        data = self.peek()
+        if data is not None:
+            self.ack()
+        return data
+
+    def close(self):
+        with self.__lock:
+            self.__close_reader()
+            if self.__writer is not None:
+                self.__writer.close()
+                self.__writer = None
+            if self.__unsaved:
+                self.__save_cursor()
+
+
 def deepcopy(obj):
     if isinstance(obj, (int, float, str, bool, type(None))):
         return obj
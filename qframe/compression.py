@@ -0,0 +1,205 @@
+# Copyright (c) Quectel Wireless Solution, Co., Ltd.All Rights Reserved.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import uio
+import uzlib
+
+
+# deflate length codes 257..285 and distance codes 0..29 (RFC 1951 3.2.5)
+_LENGTH_BASE = (3, 4, 5, 6, 7, 8, 9, 10, 11, 13, 15, 17, 19, 23, 27, 31, 35, 43, 51, 59, 67, 83, 99, 115, 131, 163,
+                195, 227, 258)
+_LENGTH_EXTRA = (0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4, 5, 5, 5, 5, 0)
+_DIST_BASE = (1, 2, 3, 4, 5, 7, 9, 13, 17, 25, 33, 49, 65, 97, 129, 193, 257, 385, 513, 769, 1025, 1537, 2049, 3073,
+              4097, 6145, 8193, 12289, 16385, 24577)
+_DIST_EXTRA = (0, 0, 0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5, 6, 6, 7, 7, 8, 8, 9, 9, 10, 10, 11, 11, 12, 12, 13, 13)
+
+WINDOW_SIZE = 32768
+MAX_MATCH = 258
+MIN_MATCH = 3
+
+
+def _reverse(code, nbits):
+    """huffman codes are sent most significant bit first into the LSB first bit stream."""
+    rv = 0
+    for _ in range(nbits):
+        rv = (rv << 1) | (code & 1)
+        code >>= 1
+    return rv
+
+
+def _fixed_literal(symbol):
+    """(code, nbits) of `symbol` in the fixed literal/length huffman code."""
+    if symbol < 144:
+        return _reverse(0x30 + symbol, 8), 8
+    if symbol < 256:
+        return _reverse(0x190 + symbol - 144, 9), 9
+    if symbol < 280:
+        return _reverse(symbol - 256, 7), 7
+    return _reverse(0xC0 + symbol - 280, 8), 8
+
+
+_tables = None
+
+
+def _get_tables():
+    """literal codes, length codes (with extra bits merged in) indexed by length - 3, distance code per
+    `_dist_index`, built on first use."""
+    global _tables
+    if _tables is None:
+        literals = [_fixed_literal(symbol) for symbol in range(257)]
+        lengths = []
+        for i in range(len(_LENGTH_BASE)):
+            code, nbits = _fixed_literal(257 + i)
+            top = _LENGTH_BASE[i + 1] if i + 1 < len(_LENGTH_BASE) else 259
+            for length in range(_LENGTH_BASE[i], min(top, 259)):
+                if len(lengths) == length - MIN_MATCH:
+                    lengths.append((code | ((length - _LENGTH_BASE[i]) << nbits), nbits + _LENGTH_EXTRA[i]))
+        dists = bytearray(512)
+        for i in range(len(_DIST_BASE)):
+            top = _DIST_BASE[i + 1] if i + 1 < len(_DIST_BASE) else WINDOW_SIZE + 1
+            for dist in range(_DIST_BASE[i], top):
+                d = dist - 1
+                dists[d if d < 256 else 256 + (d >> 7)] = i
+        codes = [_reverse(i, 5) for i in range(len(_DIST_BASE))]
+        _tables = (literals, lengths, dists, codes)
+    return _tables
+
+
+def stored_block(data, final=False):
+    """`data` (at most 65535 bytes) as an uncompressed deflate block."""
+    size = len(data)
+    return bytes((1 if final else 0, size & 0xFF, size >> 8, ~size & 0xFF, (~size >> 8) & 0xFF)) + bytes(data)
+
+
+class Deflater(object):
+    """Raw deflate (RFC 1951) compressor for small messages: LZ77 over hash chains and the fixed huffman code.
+
+    The device `uzlib` only decompresses, so this encoder is written for memory and code size rather than ratio.
+    Each `compress` call returns one complete stream. A preset `dictionary` (text typical of the messages, most
+    frequent at the end) can be referenced by matches; the peer needs the same dictionary to inflate (`zdict` of
+    `zlib.decompressobj(-15, zdict)`, `Inflater` on the device).
+    @max_chain: candidates tried per position, trades speed for ratio.
+    """
+
+    def __init__(self, dictionary=b'', max_chain=8):
+        self.dictionary = bytes(dictionary[-WINDOW_SIZE:])
+        self.max_chain = max_chain
+        self.__dict_chains = self.__index(self.dictionary, len(self.dictionary) - MIN_MATCH + 1)
+
+    def __index(self, data, end):
+        chains = {}
+        for pos in range(max(0, end)):
+            key = (data[pos] << 16) | (data[pos + 1] << 8) | data[pos + 2]
+            chain = chains.get(key)
+            if chain is None:
+                chains[key] = [pos]
+            else:
+                chain.append(pos)
+                if len(chain) > self.max_chain:
+                    del chain[0]
+        return chains
+
+    def compress(self, data):
+        literals, lengths, dists, dist_codes = _get_tables()
+        window = self.dictionary + bytes(data)
+        start = len(self.dictionary)
+        end = len(window)
+        dict_chains = self.__dict_chains
+        chains = {}
+        max_chain = self.max_chain
+        out = bytearray()
+        # BFINAL=1, BTYPE=01 (fixed huffman)
+        bitbuf = 0b011
+        bitcnt = 3
+        pos = start
+        while pos < end:
+            best_len = 0
+            best_dist = 0
+            if pos + MIN_MATCH <= end:
+                key = (window[pos] << 16) | (window[pos + 1] << 8) | window[pos + 2]
+                limit = min(MAX_MATCH, end - pos)
+                for chain in (chains.get(key), dict_chains.get(key)):
+                    if not chain:
+                        continue
+                    for i in range(len(chain) - 1, -1, -1):
+                        cand = chain[i]
+                        dist = pos - cand
+                        if dist > WINDOW_SIZE:
+                            break
+                        length = MIN_MATCH
+                        while length < limit and window[cand + length] == window[pos + length]:
+                            length += 1
+                        if length > best_len:
+                            best_len = length
+                            best_dist = dist
+                            if length == limit:
+                                break
+                    if best_len == limit:
+                        break
+            if best_len >= MIN_MATCH:
+                code, nbits = lengths[best_len - MIN_MATCH]
+                bitbuf |= code << bitcnt
+                bitcnt += nbits
+                d = best_dist - 1
+                index = dists[d if d < 256 else 256 + (d >> 7)]
+                bitbuf |= (dist_codes[index] | ((best_dist - _DIST_BASE[index]) << 5)) << bitcnt
+                bitcnt += 5 + _DIST_EXTRA[index]
+                step = best_len
+            else:
+                code, nbits = literals[window[pos]]
+                bitbuf |= code << bitcnt
+                bitcnt += nbits
+                step = 1
+            while bitcnt >= 8:
+                out.append(bitbuf & 0xFF)
+                bitbuf >>= 8
+                bitcnt -= 8
+            # index every position covered by this step
+            following = pos + step
+            stop = min(following, end - MIN_MATCH + 1)
+            while pos < stop:
+                key = (window[pos] << 16) | (window[pos + 1] << 8) | window[pos + 2]
+                chain = chains.get(key)
+                if chain is None:
+                    chains[key] = [pos]
+                else:
+                    chain.append(pos)
+                    if len(chain) > max_chain:
+                        del chain[0]
+                pos += 1
+            pos = following
+        code, nbits = literals[256]
+        bitbuf |= code << bitcnt
+        bitcnt += nbits
+        while bitcnt > 0:
+            out.append(bitbuf & 0xFF)
+            bitbuf >>= 8
+            bitcnt -= 8
+        return bytes(out)
+
+
+class Inflater(object):
+    """Raw deflate decompression on `uzlib.DecompIO`.
+
+    `uzlib` takes no preset dictionary, so the `dictionary` is replayed as a stored block ahead of every stream:
+    back references into it resolve as they would with `zdict`, and its bytes are dropped from the output.
+    """
+
+    def __init__(self, dictionary=b''):
+        self.dictionary = bytes(dictionary[-WINDOW_SIZE:])
+        self.__prefix = stored_block(self.dictionary) if self.dictionary else b''
+
+    def decompress(self, data):
+        out = uzlib.DecompIO(uio.BytesIO(self.__prefix + bytes(data)), -15).read()
+        return out[len(self.dictionary):] if self.dictionary else out
@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import utime
+import ustruct
 import _thread
 import usys as sys
 import uio as io
@@ -56,14 +57,140 @@ def getNameLevel(name):
     return _nameToLevel[temp]
 
 
+class BinaryEncoder(object):
+    """Compact binary log encoder.
+
+    The stream starts with a header record, logger names and format strings are interned by a define record on
+    first use, and each log record only carries a fixed header plus the raw arguments. Use `tools/logdecode.py`
+    on the host side to rebuild the text logs.
+
+    A format string is the first `str` item of a record. It is only interned once it shows up again, as a
+    constant text does (`logger.info('rx', size)`); messages formatted by the caller are mostly one-off strings
+    and are written inline, so they do not fill the `max_strings` table. Text arguments of at least
+    `MIN_INTERN_ARG` bytes that repeat, such as the socket a transport logs about, are interned the same way, so
+    `logger.error('read error:', self, e)` only carries the error text once both strings are known.
+    """
+    MAGIC = b'QLOG'
+    VERSION = 2
+
+    REC_HEADER = 0x00
+    REC_DEFINE = 0x01
+    REC_LOG = 0x02
+
+    LEVEL_RAW = 0xFF
+    NO_FORMAT = 0xFFFF
+
+    # shorter text arguments are cheaper inline than as a reference
+    MIN_INTERN_ARG = 8
+
+    # type, timestamp, level, logger id, format id, args count
+    LOG_HEADER_FORMAT = '<BIBHHB'
+
+    def __init__(self, stream, max_strings=512, max_candidates=64):
+        self.stream = stream
+        self.__max_strings = min(max_strings, self.NO_FORMAT - 1)
+        self.__strings = {}
+        # strings seen once, interned on their next use
+        self.__candidates = set()
+        self.__max_candidates = max_candidates
+        self.__lock = _thread.allocate_lock()
+        offset = utime.mktime(utime.localtime()) - utime.time()
+        self.__write(ustruct.pack('<B4sBi', self.REC_HEADER, self.MAGIC, self.VERSION, offset))
+
+    def __write(self, data):
+        self.stream.write(data)
+        if hasattr(self.stream, 'flush'):
+            self.stream.flush()
+
+    def __intern(self, string, force=False):
+        ident = self.__strings.get(string)
+        if ident is None:
+            if not force:
+                if len(self.__strings) >= self.__max_strings:
+                    return None
+                if string not in self.__candidates:
+                    if len(self.__candidates) >= self.__max_candidates:
+                        self.__candidates.clear()
+                    self.__candidates.add(string)
+                    return None
+                self.__candidates.discard(string)
+            ident = len(self.__strings)
+            self.__strings[string] = ident
+            data = string.encode()
+            self.__write(ustruct.pack('<BHH', self.REC_DEFINE, ident, len(data)) + data)
+        return ident
+
+    def __encode_arg(self, arg, intern=True):
+        if arg is None:
+            return b'n'
+        if arg is True:
+            return b'T'
+        if arg is False:
+            return b'F'
+        if isinstance(arg, int) and -0x80000000 <= arg <= 0x7FFFFFFF:
+            return ustruct.pack('<ci', b'i', arg)
+        if isinstance(arg, float):
+            return ustruct.pack('<cf', b'f', arg)
+        if isinstance(arg, (bytes, bytearray)):
+            data = bytes(arg)
+            tag = b'b'
+        else:
+            if not isinstance(arg, str):
+                arg = str(arg)
+            if intern and len(arg) >= self.MIN_INTERN_ARG:
+                ident = self.__intern(arg)
+                if ident is not None:
+                    return ustruct.pack('<cH', b'r', ident)
+            data = arg.encode()
+            tag = b's'
+        return ustruct.pack('<cH', tag, len(data)) + data
+
+    def encode(self, timestamp, level, name, message):
+        """encode one record, the first `str` item of message is the format string once it repeats."""
+        with self.__lock:
+            # logger names are few and always interned, format strings stop being interned once the table is full.
+            logger_id = self.__intern(name, force=True)
+            fmt_id = self.NO_FORMAT
+            args = []
+            if message and isinstance(message[0], str):
+                ident = self.__intern(message[0])
+                if ident is None:
+                    # already counted as a format string candidate
+                    args.append(self.__encode_arg(message[0], intern=False))
+                else:
+                    fmt_id = ident
+                message = message[1:]
+            args.extend([self.__encode_arg(arg) for arg in message[:255 - len(args)]])
+            header = ustruct.pack(
+                self.LOG_HEADER_FORMAT, self.REC_LOG, timestamp, level, logger_id, fmt_id, len(args)
+            )
+            self.__write(header + b''.join(args))
+
+
 class BasicConfig(object):
     logger_register_table = {}
     lock = _thread.allocate_lock()
     basic_configure = {
         'level': Level.WARN,
         'debug': True,
-        'stream': sys.stdout
+        'stream': sys.stdout,
+        'binary': False,
+        'dedup_interval': 0
     }
+    encoder = None
+    # per-name levels, e.g. {'usr.qframe.serial': Level.DEBUG}, inherited by dotted descendants.
+    name_levels = {}
+    # bumped on every level change so that loggers can cache their effective level.
+    generation = 0
+
+    @classmethod
+    def getEncoder(cls):
+        """binary encoder bound to the current stream, the stream must be opened in binary mode."""
+        with cls.lock:
+            stream = cls.basic_configure['stream']
+            if cls.encoder is None or cls.encoder.stream is not stream:
+                cls.encoder = BinaryEncoder(stream)
+            return cls.encoder
 
     @classmethod
     def getLogger(cls, name):
@@ -81,6 +208,7 @@ class BasicConfig(object):
         if level is not None:
             kwargs['level'] = getNameLevel(level)
         with cls.lock:
+            cls.generation += 1
             return cls.basic_configure.update(kwargs)
 
     @classmethod
@@ -93,13 +221,47 @@ class BasicConfig(object):
         if key == 'level':
             value = getNameLevel(value)
         with cls.lock:
+            cls.generation += 1
             cls.basic_configure[key] = value
 
+    @classmethod
+    def setLevel(cls, name, level):
+        """set level for logger `name` and its dotted descendants, `None` to inherit from the parent again."""
+        if level is not None:
+            level = getNameLevel(level)
+        with cls.lock:
+            cls.generation += 1
+            if level is None:
+                cls.name_levels.pop(name, None)
+            else:
+                cls.name_levels[name] = level
+
+    @classmethod
+    def getEffectiveLevel(cls, name):
+        """returns (generation, level) so that callers can cache the result."""
+        with cls.lock:
+            while name:
+                if name in cls.name_levels:
+                    return cls.generation, cls.name_levels[name]
+                index = name.rfind('.')
+                name = name[:index] if index > 0 else ''
+            if cls.basic_configure['debug']:
+                return cls.generation, Level.DEBUG
+            return cls.generation, cls.basic_configure['level']
+
 
 class Logger(object):
+    # max number of throttled call sites remembered per logger
+    max_throttle_keys = 16
 
     def __init__(self, name):
         self.name = name
+        self.dedup_interval = None
+        self.__level_cache = (-1, Level.DEBUG)
+        self.__throttle = {}
+        # number of throttle entries holding suppressed messages not reported yet
+        self.__pending = 0
+        self.__throttle_lock = _thread.allocate_lock()
 
     @staticmethod
     def __get_formatted_time():
@@ -114,10 +276,86 @@ class Logger(object):
             cur_time_tuple[5]
         )
 
-    def log(self, level, *message):
-        if not BasicConfig.get('debug'):
-            if level < BasicConfig.get('level'):
+    def setLevel(self, level):
+        BasicConfig.setLevel(self.name, level)
+
+    def getEffectiveLevel(self):
+        generation, level = self.__level_cache
+        if generation != BasicConfig.generation:
+            generation, level = BasicConfig.getEffectiveLevel(self.name)
+            self.__level_cache = (generation, level)
+        return level
+
+    def isEnabledFor(self, level):
+        return level >= self.getEffectiveLevel()
+
+    def setDedup(self, interval):
+        """suppress repeated messages within `interval` seconds, `None` to follow BasicConfig `dedup_interval`."""
+        self.dedup_interval = interval
+
+    def __throttled(self, level, key, interval):
+        """returns (suppress, repeated, expired), `repeated` is the number of messages suppressed since the last
+        output, `expired` lists (level, repeated, key) of other keys whose suppressed messages are due to be
+        reported because their interval passed or they are evicted."""
+        now = utime.ticks_ms()
+        expired = []
+        with self.__throttle_lock:
+            if self.__pending:
+                for k, v in self.__throttle.items():
+                    if v[1] and k != key and utime.ticks_diff(now, v[0]) >= interval * 1000:
+                        expired.append((v[2], v[1], k))
+                        v[1] = 0
+                        self.__pending -= 1
+            entry = self.__throttle.get(key)
+            if entry is not None:
+                if utime.ticks_diff(now, entry[0]) < interval * 1000:
+                    if not entry[1]:
+                        self.__pending += 1
+                    entry[1] += 1
+                    return True, 0, expired
+                if entry[1]:
+                    self.__pending -= 1
+                self.__throttle[key] = [now, 0, level]
+                return False, entry[1], expired
+            if len(self.__throttle) >= self.max_throttle_keys:
+                oldest = None
+                for k, v in self.__throttle.items():
+                    if oldest is None or utime.ticks_diff(v[0], self.__throttle[oldest][0]) < 0:
+                        oldest = k
+                entry = self.__throttle.pop(oldest)
+                if entry[1]:
+                    expired.append((entry[2], entry[1], oldest))
+                    self.__pending -= 1
+            self.__throttle[key] = [now, 0, level]
+            return False, 0, expired
+
+    def log(self, level, *message, key=None):
+        """`key` names the call site for rate limiting, messages sharing a key are throttled together even when
+        their text differs. Without a key, identical messages are deduplicated. Suppressed messages are reported
+        as 'message repeated N times' by the next call of this logger once their interval passed."""
+        if level < self.getEffectiveLevel():
+            return
+        interval = self.dedup_interval
+        if interval is None:
+            interval = BasicConfig.get('dedup_interval')
+        if interval and interval > 0:
+            if key is None:
+                key = (level, ' '.join([str(item) for item in message]))
+            suppress, repeated, expired = self.__throttled(level, key, interval)
+            for expired_level, count, expired_key in expired:
+                if isinstance(expired_key, tuple):
+                    expired_key = expired_key[1]
+                self.__emit(expired_level, ('message repeated {} times: {}'.format(count, expired_key),))
+            if suppress:
                 return
+            if repeated:
+                self.__emit(level, ('message repeated {} times'.format(repeated),))
+        self.__emit(level, message)
+
+    def __emit(self, level, message):
+        if BasicConfig.get('binary'):
+            BasicConfig.getEncoder().encode(utime.time(), level, self.name, message)
+            return
         stream = BasicConfig.get('stream')
         prefix = '[{}][{}][{}]'.format(
             self.__get_formatted_time(),
@@ -128,22 +366,25 @@ class Logger(object):
         if isinstance(stream, io.TextIOWrapper):
             stream.flush()
 
-    def debug(self, *message):
-        self.log(Level.DEBUG, *message)
+    def debug(self, *message, key=None):
+        self.log(Level.DEBUG, *message, key=key)
 
-    def info(self, *message):
-        self.log(Level.INFO, *message)
+    def info(self, *message, key=None):
+        self.log(Level.INFO, *message, key=key)
 
-    def warn(self, *message):
-        self.log(Level.WARN, *message)
+    def warn(self, *message, key=None):
+        self.log(Level.WARN, *message, key=key)
 
-    def error(self, *message):
-        self.log(Level.ERROR, *message)
+    def error(self, *message, key=None):
+        self.log(Level.ERROR, *message, key=key)
 
-    def critical(self, *message):
-        self.log(Level.CRITICAL, *message)
+    def critical(self, *message, key=None):
+        self.log(Level.CRITICAL, *message, key=key)
 
     def output_raw(self, info):
+        if BasicConfig.get('binary'):
+            BasicConfig.getEncoder().encode(utime.time(), BinaryEncoder.LEVEL_RAW, self.name, (info,))
+            return
         stream = BasicConfig.get('stream')
         print(info, file=stream)
 
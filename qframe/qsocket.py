@@ -12,12 +12,148 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import utime
 import usocket
+import uselect
 from .logging import getLogger
-from .threading import Lock
+from .threading import Lock, Thread
+from .collections import BufferPool
 
 logger = getLogger(__name__)
 
+# connect() in progress on a non-blocking socket (lwIP / Linux numbering)
+_EINPROGRESS = (115, 119)
+
+
+def _connect_error(sock):
+    """pending error of a non-blocking connect reported writable, 0 if it succeeded or the stack cannot tell."""
+    try:
+        return sock.getsockopt(usocket.SOL_SOCKET, usocket.SO_ERROR)
+    except (AttributeError, OSError):
+        return 0
+
+# shared receive buffers for readers using `TcpSocket.readinto`
+rx_buffers = BufferPool(size=1024, count=2)
+
+
+class Resolver(object):
+    """Shared `getaddrinfo` cache.
+
+    Answers are fresh for `ttl` seconds. Until `stale_ttl` they are still served while a background thread refreshes
+    them, and they are also served if that refresh fails. Failures with nothing cached are remembered for
+    `negative_ttl` seconds. Pinned hosts never hit DNS.
+    """
+
+    def __init__(self, ttl=300, negative_ttl=10, stale_ttl=86400):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.__cache = {}
+        self.__failed = {}
+        self.__pins = {}
+        self.__refreshing = set()
+        self.__lock = Lock()
+
+    def configure(self, ttl=None, negative_ttl=None, stale_ttl=None, pins=None):
+        """apply config `DNS`, e.g. {"ttl": 300, "pins": {"example.com": "1.2.3.4"}}."""
+        if ttl is not None:
+            self.ttl = ttl
+        if negative_ttl is not None:
+            self.negative_ttl = negative_ttl
+        if stale_ttl is not None:
+            self.stale_ttl = stale_ttl
+        for host, ip in (pins or {}).items():
+            self.pin(host, ip)
+
+    def pin(self, host, ip):
+        with self.__lock:
+            self.__pins[host] = ip
+
+    def unpin(self, host):
+        with self.__lock:
+            self.__pins.pop(host, None)
+
+    def clear(self):
+        with self.__lock:
+            self.__cache.clear()
+            self.__failed.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'failures': self.failures,
+            'entries': len(self.__cache),
+        }
+
+    @staticmethod
+    def __lookup(host, port):
+        rv = usocket.getaddrinfo(host, port)
+        if not rv:
+            raise ValueError('DNS detect error')
+        return rv
+
+    def __store(self, key, rv):
+        now = utime.time()
+        with self.__lock:
+            self.__cache[key] = (rv, now + self.ttl, now + self.stale_ttl)
+            self.__failed.pop(key, None)
+
+    def __refresh(self, key):
+        try:
+            self.__store(key, self.__lookup(*key))
+        except Exception as e:
+            self.failures += 1
+            logger.warn('refresh dns failed, keep serving cached address:', key[0], e, key='refresh')
+            with self.__lock:
+                self.__failed[key] = utime.time() + self.negative_ttl
+        finally:
+            with self.__lock:
+                self.__refreshing.discard(key)
+
+    def getaddrinfo(self, host, port):
+        key = (host, port)
+        now = utime.time()
+        with self.__lock:
+            ip = self.__pins.get(host)
+            if ip is not None:
+                family = usocket.AF_INET6 if ':' in ip else usocket.AF_INET
+                return [(family, usocket.SOCK_STREAM, 0, host, (ip, port))]
+            entry = self.__cache.get(key)
+            if entry is not None:
+                rv, expires, stale_until = entry
+                if now < expires:
+                    self.hits += 1
+                    return rv
+                if now < stale_until:
+                    self.stale_hits += 1
+                    if key not in self.__refreshing and now >= self.__failed.get(key, 0):
+                        self.__refreshing.add(key)
+                        Thread(target=self.__refresh, args=(key,)).start()
+                    return rv
+                del self.__cache[key]
+            if now < self.__failed.get(key, 0):
+                raise ValueError('DNS detect error (cached failure)')
+            self.misses += 1
+        try:
+            rv = self.__lookup(host, port)
+        except Exception:
+            self.failures += 1
+            with self.__lock:
+                self.__failed[key] = utime.time() + self.negative_ttl
+            raise
+        self.__store(key, rv)
+        return rv
+
+
+# shared by every socket, configured from app config `DNS`
+resolver = Resolver()
+
 
 class TcpSocket(object):
     socket_type = usocket.SOCK_STREAM
@@ -25,7 +161,15 @@ class TcpSocket(object):
     class TimeoutError(Exception):
         pass
 
-    def __init__(self, host, port, timeout=None, keep_alive=None):
+    def __init__(self, host, port, timeout=None, keep_alive=None, endpoints=None, stagger=0.25,
+                 connect_timeout=30):
+        """
+        @endpoints: extra [host, port] pairs to fail over to. Every address resolved for every endpoint is a
+        connect candidate; candidates are tried in order of measured connect time (the never tried ones next, the
+        ones whose last attempt failed last), the next one is started every `stagger` seconds while earlier attempts
+        are still pending, and the first to connect wins.
+        @connect_timeout: overall limit (s) for racing connects.
+        """
         self.__host = host
         self.__port = port
         self.__ip = None
@@ -34,6 +178,14 @@ class TcpSocket(object):
         self.__timeout = timeout
         self.__keep_alive = keep_alive
         self.__sock = None
+        self.__endpoints = [(host, port)] + [tuple(endpoint) for endpoint in (endpoints or ())]
+        self.__stagger = stagger
+        self.__connect_timeout = connect_timeout
+        # (ip, port) -> smoothed connect time (ms) of successful connects
+        self.__connect_rtt = {}
+        # (ip, port) -> failed connects since the last successful one
+        self.__connect_failures = {}
+        self.__pending = None
 
     def __str__(self):
         return '{}(host=\"{}\",port={})'.format(type(self).__name__, self.__host, self.__port)
@@ -45,29 +197,228 @@ class TcpSocket(object):
         return self.__sock
 
     def __init_args(self):
-        rv = usocket.getaddrinfo(self.__host, self.__port)
-        if not rv:
-            raise ValueError('DNS detect error')
+        rv = resolver.getaddrinfo(self.__host, self.__port)
         self.__family = rv[0][0]
         self.__domain = rv[0][3]
         self.__ip, self.__port = rv[0][4]
 
+    def __candidates(self):
+        """[(family, domain, (ip, port))] for every resolved address of every endpoint, fastest known first."""
+        candidates = []
+        error = None
+        for host, port in self.__endpoints:
+            try:
+                rv = resolver.getaddrinfo(host, port)
+            except Exception as e:
+                error = e
+                continue
+            for info in rv:
+                candidate = (info[0], info[3], tuple(info[4]))
+                if candidate not in candidates:
+                    candidates.append(candidate)
+        if not candidates:
+            raise error or ValueError('DNS detect error')
+        # stable sort: working candidates by connect time, then the never tried ones in config order, then the ones
+        # whose last attempt failed, least failures first
+        order = []
+        for i, c in enumerate(candidates):
+            failures = self.__connect_failures.get(c[2], 0)
+            rank = 2 if failures else (0 if c[2] in self.__connect_rtt else 1)
+            order.append((rank, failures, self.__connect_rtt.get(c[2], 0), i))
+        order.sort()
+        return [candidates[item[-1]] for item in order]
+
+    def __record_rtt(self, addr, rtt):
+        last = self.__connect_rtt.get(addr)
+        self.__connect_rtt[addr] = rtt if last is None else (last * 3 + rtt) / 4
+        self.__connect_failures.pop(addr, None)
+
+    def __record_failure(self, addr):
+        self.__connect_failures[addr] = self.__connect_failures.get(addr, 0) + 1
+
+    def connect_stats(self):
+        """smoothed connect time (ms) per address, None for addresses whose last attempt failed."""
+        stats = dict(self.__connect_rtt)
+        for addr in self.__connect_failures:
+            stats[addr] = None
+        return stats
+
+    def __race(self, candidates):
+        """happy-eyeballs style connect, returns (sock, candidate) of the first attempt that completes."""
+        poller = uselect.poll()
+        pending = {}
+        by_fd = {}
+        start = utime.ticks_ms()
+        deadline = utime.ticks_add(start, int(self.__connect_timeout * 1000))
+        next_start = start
+        index = 0
+        error = None
+        try:
+            while True:
+                now = utime.ticks_ms()
+                if index < len(candidates) and (not pending or utime.ticks_diff(now, next_start) >= 0):
+                    candidate = candidates[index]
+                    index += 1
+                    sock = usocket.socket(candidate[0], self.socket_type)
+                    sock.setblocking(False)
+                    try:
+                        sock.connect(candidate[2])
+                    except OSError as e:
+                        if e.args[0] not in _EINPROGRESS:
+                            sock.close()
+                            self.__record_failure(candidate[2])
+                            error = e
+                            continue
+                    poller.register(sock, uselect.POLLOUT | uselect.POLLERR | uselect.POLLHUP)
+                    pending[id(sock)] = (sock, candidate, now)
+                    if hasattr(sock, 'fileno'):
+                        by_fd[sock.fileno()] = sock
+                    next_start = utime.ticks_add(now, int(self.__stagger * 1000))
+                    continue
+                if not pending:
+                    raise error or OSError('all endpoints failed')
+                wait = utime.ticks_diff(deadline, now)
+                if wait <= 0:
+                    for _, candidate, _ in pending.values():
+                        self.__record_failure(candidate[2])
+                    raise OSError(110, 'connect timeout')
+                if index < len(candidates):
+                    wait = min(wait, max(0, utime.ticks_diff(next_start, now)))
+                for obj, event in poller.poll(wait):
+                    sock = by_fd.get(obj, obj)
+                    sock, candidate, begin = pending.pop(id(sock))
+                    poller.unregister(sock)
+                    elapsed = utime.ticks_diff(utime.ticks_ms(), begin)
+                    if event & (uselect.POLLERR | uselect.POLLHUP):
+                        code = -1
+                    else:
+                        # some stacks report a refused connect as writable only
+                        code = _connect_error(sock)
+                    if code:
+                        sock.close()
+                        self.__record_failure(candidate[2])
+                        error = OSError('connect {} failed'.format(candidate[2]))
+                        continue
+                    self.__record_rtt(candidate[2], elapsed)
+                    sock.setblocking(True)
+                    return sock, candidate
+        finally:
+            # attempts still in progress lost the race, they did not fail
+            for sock, _, _ in pending.values():
+                sock.close()
+
     def connect(self):
-        self.__init_args()
-        self.__sock = usocket.socket(self.__family, self.socket_type)
-        self.__sock.connect((self.__ip, self.__port))
+        if self.socket_type == usocket.SOCK_STREAM:
+            candidates = self.__candidates()
+            if len(candidates) > 1:
+                self.__sock, candidate = self.__race(candidates)
+            else:
+                candidate = candidates[0]
+                self.__sock = usocket.socket(candidate[0], self.socket_type)
+                self.__sock.connect(candidate[2])
+            self.__family, self.__domain, (self.__ip, self.__port) = candidate
+        else:
+            self.__init_args()
+            self.__sock = usocket.socket(self.__family, self.socket_type)
+            self.__sock.connect((self.__ip, self.__port))
+        self.__configure()
+
+    def connect_start(self):
+        """start connecting to the fastest known candidate without blocking (name resolution still may), returns the
+        raw socket which becomes writable once connected. finish with `connect_finish`."""
+        candidate = self.__candidates()[0]
+        sock = usocket.socket(candidate[0], self.socket_type)
+        sock.setblocking(False)
+        try:
+            sock.connect(candidate[2])
+        except OSError as e:
+            if e.args[0] not in _EINPROGRESS:
+                sock.close()
+                self.__record_failure(candidate[2])
+                raise e
+        self.__sock = sock
+        self.__pending = (candidate, utime.ticks_ms())
+        return sock
+
+    def connect_finish(self, ok=True):
+        """complete a `connect_start`, `ok` False when the attempt failed or timed out."""
+        candidate, begin = self.__pending
+        self.__pending = None
+        code = _connect_error(self.__sock) if ok else 0
+        if not ok or code:
+            self.__record_failure(candidate[2])
+            self.disconnect()
+            if code:
+                raise OSError(code, 'connect {} failed'.format(candidate[2]))
+            return
+        self.__record_rtt(candidate[2], utime.ticks_diff(utime.ticks_ms(), begin))
+        self.__family, self.__domain, (self.__ip, self.__port) = candidate
+        self.__sock.setblocking(True)
+        self.__configure()
+
+    def __configure(self):
         if self.__timeout and self.__timeout > 0:
             self.__sock.settimeout(self.__timeout)
         if self.__keep_alive and self.__keep_alive > 0:
             self.__sock.setsockopt(usocket.SOL_SOCKET, usocket.TCP_KEEPALIVE, self.__keep_alive)
+        try:
+            self.__sock = self._wrap(self.__sock)
+        except Exception as e:
+            self.__sock.close()
+            self.__sock = None
+            raise e
+
+    def _wrap(self, sock):
+        """hook called with the connected socket, returns the socket used for I/O (e.g. a TLS session)."""
+        return sock
 
     def disconnect(self):
         if self.__sock:
             self.__sock.close()
             self.__sock = None
 
+    def __send_view(self, view, deadline):
+        sent = 0
+        total = len(view)
+        while sent < total:
+            try:
+                size = self.sock.send(view[sent:])
+            except OSError as e:
+                # EAGAIN / ETIMEDOUT: socket buffer full for the whole socket timeout, retry until the deadline.
+                # without a deadline the socket timeout is the limit, as for a plain `send`
+                if e.args[0] not in (11, 110) or deadline is None:
+                    raise e
+                size = 0
+            sent += size or 0
+            if sent < total:
+                if deadline is not None and utime.ticks_diff(deadline, utime.ticks_ms()) <= 0:
+                    raise self.TimeoutError('{} send timeout'.format(self))
+                if not size:
+                    utime.sleep_ms(10)
+        return sent
+
+    @staticmethod
+    def __deadline(timeout):
+        if timeout is None:
+            return None
+        return utime.ticks_add(utime.ticks_ms(), int(timeout * 1000))
+
+    def sendall(self, data, timeout=None):
+        """send all of `data`, retrying partial sends on memoryview slices without copying.
+        raises `TimeoutError` when `timeout` (s) expires first; with no `timeout` a send blocked for the socket
+        timeout raises its OSError."""
+        return self.__send_view(memoryview(data), self.__deadline(timeout))
+
+    def sendv(self, buffers, timeout=None):
+        """send several buffers back to back (e.g. header and body) without joining them."""
+        deadline = self.__deadline(timeout)
+        total = 0
+        for buf in buffers:
+            total += self.__send_view(memoryview(buf), deadline)
+        return total
+
     def write(self, data):
-        return self.sock.send(data) == len(data)
+        return self.sendall(data) == len(data)
 
     def read(self, size=1024):
         try:
@@ -79,6 +430,29 @@ class TcpSocket(object):
             else:
                 raise e
 
+    def readinto(self, buf, nbytes=None):
+        """read into `buf` without allocating, returns the number of bytes read (0 when closed by peer)."""
+        if nbytes is None:
+            nbytes = len(buf)
+        try:
+            if hasattr(self.sock, 'readinto'):
+                size = self.sock.readinto(buf, nbytes)
+            else:
+                # firmware without socket.readinto
+                data = self.sock.recv(nbytes)
+                size = len(data)
+                buf[:size] = data
+        except Exception as e:
+            if isinstance(e, OSError) and e.args[0] == 110:
+                # read timeout.
+                raise self.TimeoutError(str(self))
+            else:
+                raise e
+        if size is None:
+            # no data within the socket timeout
+            raise self.TimeoutError(str(self))
+        return size
+
     @property
     def status_code(self):
         if self.__sock is None:
@@ -86,6 +460,331 @@ class TcpSocket(object):
         return self.__sock.getsocketsta()
 
 
+class _Entry(object):
+    __slots__ = ('tsock', 'sock', 'connecting', 'on_readable', 'on_connect', 'on_error', 'idle_timeout', 'on_idle',
+                 'last', 'deadline')
+
+
+class Reactor(object):
+    """Dispatches read readiness, connect completion, idle timeouts and timers of many sockets from one thread.
+
+    Sockets are `TcpSocket`/`UdpSocket` objects, callbacks get the socket object and run on the reactor thread, so
+    they must not block. Changes are queued and applied by the reactor thread at its next wakeup. An idle reactor
+    sleeps until its next timer or deadline; changes queued from another thread wake it through a loopback UDP
+    socket. Where that socket cannot be created the reactor falls back to waking every `max_wait` seconds.
+
+    Some blocking work still runs on the reactor thread and stalls every socket meanwhile: name resolution in
+    `connect` (cached by `resolver`, pin addresses to avoid it) and the TLS handshake of `SslTcpSocket` when its
+    connect completes.
+    """
+
+    def __init__(self, max_wait=0.5):
+        self.max_wait = max_wait
+        self.__waker = None
+        self.__waker_addr = None
+        self.__lock = Lock()
+        self.__ops = []
+        self.__poller = uselect.poll()
+        self.__entries = {}
+        self.__by_fd = {}
+        self.__timers = []
+        self.__seq = 0
+        self.__thread = Thread(target=self.__run)
+
+    def start(self):
+        # callers on several threads must not start two loops
+        with self.__lock:
+            if not self.__thread.is_running():
+                self.__thread.start()
+
+    def __queue(self, op, arg):
+        with self.__lock:
+            self.__ops.append((op, arg))
+        self.start()
+        if self.__waker is not None and Thread.get_current_thread_ident() != self.__thread.ident:
+            try:
+                self.__waker.sendto(b'\x00', self.__waker_addr)
+            except Exception:
+                # the reactor wakes up at its next deadline anyway
+                pass
+
+    def __make_waker(self):
+        try:
+            sock = usocket.socket(usocket.AF_INET, usocket.SOCK_DGRAM)
+        except Exception as e:
+            logger.warn('reactor has no wakeup socket ({}), polling every {}s'.format(e, self.max_wait))
+            return
+        try:
+            sock.bind(('127.0.0.1', 0))
+            addr = sock.getsockname()
+            sock.setblocking(False)
+            self.__poller.register(sock, uselect.POLLIN)
+        except Exception as e:
+            logger.warn('reactor has no wakeup socket ({}), polling every {}s'.format(e, self.max_wait))
+            sock.close()
+            return
+        if hasattr(sock, 'fileno'):
+            self.__by_fd[sock.fileno()] = sock
+        self.__waker_addr = addr
+        self.__waker = sock
+
+    def __drain_waker(self):
+        while True:
+            try:
+                if not self.__waker.recv(64):
+                    return
+            except Exception:
+                return
+
+    def register(self, tsock, on_readable, on_error=None, idle_timeout=None, on_idle=None):
+        """watch a connected socket, `on_readable(tsock)` reads it, `on_idle(tsock)` is called every
+        `idle_timeout` seconds without readable data. `on_error(tsock, exc)` on poll errors or hang up."""
+        entry = _Entry()
+        entry.tsock = tsock
+        entry.sock = tsock.sock
+        entry.connecting = False
+        entry.on_readable = on_readable
+        entry.on_connect = None
+        entry.on_error = on_error
+        entry.idle_timeout = idle_timeout
+        entry.on_idle = on_idle
+        entry.last = utime.ticks_ms()
+        entry.deadline = None
+        self.__queue('add', entry)
+
+    def connect(self, tsock, on_connect, on_error, timeout=30):
+        """connect without blocking (`TcpSocket.connect_start`), `on_connect(tsock)` once connected, else
+        `on_error(tsock, exc)`. The socket is not watched for reads until `register` is called."""
+        try:
+            sock = tsock.connect_start()
+        except Exception as e:
+            self.call_later(0, on_error, tsock, e)
+            return
+        entry = _Entry()
+        entry.tsock = tsock
+        entry.sock = sock
+        entry.connecting = True
+        entry.on_readable = None
+        entry.on_connect = on_connect
+        entry.on_error = on_error
+        entry.idle_timeout = None
+        entry.on_idle = None
+        entry.last = utime.ticks_ms()
+        entry.deadline = utime.ticks_add(entry.last, int(timeout * 1000))
+        self.__queue('add', entry)
+
+    def unregister(self, tsock):
+        self.__queue('remove', tsock)
+
+    def call_later(self, delay, callback, *args):
+        """run `callback(*args)` on the reactor thread after `delay` seconds, returns a handle for `cancel`."""
+        with self.__lock:
+            self.__seq += 1
+            handle = [utime.ticks_add(utime.ticks_ms(), int(delay * 1000)), self.__seq, callback, args, False]
+        self.__queue('timer', handle)
+        return handle
+
+    @staticmethod
+    def cancel(handle):
+        handle[4] = True
+
+    def __apply(self):
+        with self.__lock:
+            ops = self.__ops
+            self.__ops = []
+        for op, arg in ops:
+            if op == 'add':
+                self.__remove(arg.tsock)
+                events = uselect.POLLOUT if arg.connecting else uselect.POLLIN
+                self.__entries[id(arg.sock)] = arg
+                try:
+                    self.__poller.register(arg.sock, events | uselect.POLLERR | uselect.POLLHUP)
+                except Exception as e:
+                    self.__fail(arg, e)
+                    continue
+                if hasattr(arg.sock, 'fileno'):
+                    self.__by_fd[arg.sock.fileno()] = arg.sock
+            elif op == 'remove':
+                self.__remove(arg)
+            else:
+                self.__timers.append(arg)
+                self.__timers.sort(key=lambda t: (utime.ticks_diff(t[0], arg[0]), t[1]))
+
+    def __remove(self, tsock):
+        for key, entry in list(self.__entries.items()):
+            if entry.tsock is tsock:
+                del self.__entries[key]
+                try:
+                    self.__poller.unregister(entry.sock)
+                except Exception:
+                    pass
+                for fd, sock in list(self.__by_fd.items()):
+                    if sock is entry.sock:
+                        del self.__by_fd[fd]
+
+    def __call(self, callback, *args):
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.error('reactor callback error:', callback, e, key='reactor')
+
+    def __fail(self, entry, error):
+        self.__remove(entry.tsock)
+        if entry.connecting:
+            entry.tsock.connect_finish(False)
+        if entry.on_error is not None:
+            self.__call(entry.on_error, entry.tsock, error)
+
+    def __run_timers(self, now):
+        while self.__timers and utime.ticks_diff(self.__timers[0][0], now) <= 0:
+            _, _, callback, args, cancelled = self.__timers.pop(0)
+            if not cancelled:
+                self.__call(callback, *args)
+
+    def __check_deadlines(self, now):
+        """handle connect and idle timeouts, returns ms until the next one (-1: none, wait for an event)."""
+        wait = -1 if self.__waker is not None else int(self.max_wait * 1000)
+        for entry in list(self.__entries.values()):
+            if entry.connecting:
+                left = utime.ticks_diff(entry.deadline, now)
+                if left <= 0:
+                    self.__fail(entry, OSError(110, 'connect timeout'))
+                    continue
+            elif entry.idle_timeout:
+                left = utime.ticks_diff(utime.ticks_add(entry.last, int(entry.idle_timeout * 1000)), now)
+                if left <= 0:
+                    entry.last = now
+                    if entry.on_idle is not None:
+                        self.__call(entry.on_idle, entry.tsock)
+                    left = int(entry.idle_timeout * 1000)
+            else:
+                continue
+            wait = left if wait < 0 else min(wait, left)
+        return wait
+
+    def __dispatch(self, obj, event):
+        sock = self.__by_fd.get(obj, obj)
+        if sock is self.__waker:
+            self.__drain_waker()
+            return
+        entry = self.__entries.get(id(sock))
+        if entry is None:
+            return
+        if event & (uselect.POLLERR | uselect.POLLHUP) and not event & uselect.POLLIN:
+            self.__fail(entry, OSError('{} poll error {}'.format(entry.tsock, event)))
+            return
+        entry.last = utime.ticks_ms()
+        if entry.connecting:
+            self.__remove(entry.tsock)
+            try:
+                entry.tsock.connect_finish(True)
+            except Exception as e:
+                if entry.on_error is not None:
+                    self.__call(entry.on_error, entry.tsock, e)
+                return
+            self.__call(entry.on_connect, entry.tsock)
+        else:
+            self.__call(entry.on_readable, entry.tsock)
+
+    def __run(self):
+        if self.__waker is None:
+            self.__make_waker()
+        while True:
+            self.__apply()
+            now = utime.ticks_ms()
+            self.__run_timers(now)
+            wait = self.__check_deadlines(now)
+            # callbacks above may have queued changes
+            self.__apply()
+            if self.__timers:
+                left = max(0, utime.ticks_diff(self.__timers[0][0], now))
+                wait = left if wait < 0 else min(wait, left)
+            for obj, event in self.__poller.poll(wait):
+                self.__dispatch(obj, event)
+
+
+# shared reactor for extensions running in reactor mode
+reactor = Reactor()
+
+
+class SslTcpSocket(TcpSocket):
+    """TcpSocket over TLS (`ussl.wrap_socket`), the handshake runs on every connect.
+
+    `ca_certs`, `certfile` and `keyfile` are PEM contents as `ussl` expects them; with `ca_certs` the server
+    certificate is verified. `psk` is an (identity, key) pair for firmware whose `ussl` accepts a `psk` argument.
+    With `session_cache` the TLS session of the last connection is offered again on reconnect to skip the full
+    handshake, if `ussl.wrap_socket` supports a `session` argument; otherwise every handshake is a full one.
+    """
+
+    def __init__(self, host, port, ca_certs=None, certfile=None, keyfile=None, server_hostname=None, psk=None,
+                 session_cache=True, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self.__options = {
+            'ca_certs': ca_certs,
+            'certfile': certfile,
+            'keyfile': keyfile,
+            'server_hostname': server_hostname or host,
+            'psk': psk,
+        }
+        self.session_cache = session_cache
+        self.__session = None
+        self.__session_supported = True
+        self.__stats = {'handshakes': 0, 'resumed': 0, 'failures': 0, 'last_ms': 0, 'max_ms': 0, 'total_ms': 0}
+
+    def _wrap(self, sock):
+        import ussl
+        kwargs = dict((k, v) for k, v in self.__options.items() if v is not None)
+        if 'ca_certs' in kwargs:
+            kwargs['cert_reqs'] = getattr(ussl, 'CERT_REQUIRED', 2)
+        if self.session_cache and self.__session_supported and self.__session is not None:
+            kwargs['session'] = self.__session
+        start = utime.ticks_ms()
+        try:
+            try:
+                ssl_sock = ussl.wrap_socket(sock, **kwargs)
+            except TypeError as e:
+                if 'session' not in kwargs:
+                    if 'psk' in kwargs:
+                        raise ValueError('PSK not supported by ussl: {}'.format(e))
+                    raise e
+                # firmware without session resumption, fall back to full handshakes
+                self.__session_supported = False
+                self.__session = None
+                kwargs.pop('session')
+                ssl_sock = ussl.wrap_socket(sock, **kwargs)
+        except Exception as e:
+            self.__stats['failures'] += 1
+            # a rejected session must not be offered again
+            self.__session = None
+            raise e
+        elapsed = utime.ticks_diff(utime.ticks_ms(), start)
+        stats = self.__stats
+        stats['handshakes'] += 1
+        stats['last_ms'] = elapsed
+        stats['max_ms'] = max(stats['max_ms'], elapsed)
+        stats['total_ms'] += elapsed
+        if getattr(ssl_sock, 'session_reused', False):
+            stats['resumed'] += 1
+        logger.debug('handshake ms:', self, elapsed)
+        return ssl_sock
+
+    def disconnect(self):
+        if self.session_cache and self.__session_supported:
+            try:
+                # TLS 1.3 tickets arrive after the handshake, take the session at the end of the connection
+                self.__session = getattr(self.sock, 'session', None) or self.__session
+            except ValueError:
+                pass
+        super().disconnect()
+
+    def handshake_stats(self):
+        """handshake counters, `resumed` counts handshakes that reused the cached session."""
+        stats = dict(self.__stats)
+        stats['session_cached'] = self.__session is not None
+        stats['session_supported'] = self.__session_supported
+        return stats
+
+
 class UdpSocket(TcpSocket):
     socket_type = usocket.SOCK_DGRAM
 
@@ -118,3 +817,11 @@ class UdpSocket(TcpSocket):
             if not isinstance(e, self.TimeoutError):
                 self.status_code = 98
             raise e
+
+    def readinto(self, buf, nbytes=None):
+        try:
+            return super().readinto(buf, nbytes=nbytes)
+        except Exception as e:
+            if not isinstance(e, self.TimeoutError):
+                self.status_code = 98
+            raise e
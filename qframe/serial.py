@@ -12,8 +12,96 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from machine import UART
-from .threading import Condition, Lock
+import utime
+from .threading import Condition, Lock, Thread, SpscSignal
+from .collections import BufferPool, RingBuffer
+from .codecs import FrameDecoder, SizedFrameDecoder, FixedSizeDecoder, LengthPrefixDecoder, DelimiterDecoder  # noqa
+from .logging import getLogger
+
+
+logger = getLogger(__name__)
+
+
+# shared receive buffers for readers using `Serial.readinto`
+rx_buffers = BufferPool(size=1024, count=2)
+
+
+class UartBackend(object):
+    """Serial backend interface, the default implementation opens a `machine.UART`.
+
+    `open` returns a port object providing `any()`, `read(n)`, `write(data)`, `close()` and `set_callback(fn)`,
+    optionally `readinto(buf, n)`.
+    """
+
+    def open(self, port, baudrate, bytesize, parity, stopbits, flowctl, rs485_config=None):
+        from machine import UART
+        uart = UART(getattr(UART, 'UART{}'.format(port)), baudrate, bytesize, parity, stopbits, flowctl)
+        if isinstance(rs485_config, dict):
+            gpio_num = getattr(UART, "GPIO{}".format(rs485_config['gpio_num']))
+            direction = rs485_config['direction']
+            uart.control_485(gpio_num, direction)
+        return uart
+
+
+class LoopbackPort(object):
+    """In-memory port: `inject` plays the peer sending to us, written bytes loop back to RX when `loop` is set,
+    otherwise they are kept in `tx`."""
+
+    def __init__(self, loop=True):
+        self.loop = loop
+        self.tx = bytearray()
+        self.__rx = bytearray()
+        self.__lock = Lock()
+        self.__callback = None
+
+    def set_callback(self, fn):
+        self.__callback = fn
+
+    def inject(self, data):
+        with self.__lock:
+            self.__rx.extend(data)
+        if self.__callback is not None:
+            self.__callback(None)
+
+    def any(self):
+        return len(self.__rx)
+
+    def readinto(self, buf, nbytes=None):
+        with self.__lock:
+            size = min(len(self.__rx), len(buf) if nbytes is None else nbytes)
+            buf[:size] = self.__rx[:size]
+            self.__rx[:size] = b''
+            return size
+
+    def read(self, nbytes):
+        with self.__lock:
+            data = bytes(self.__rx[:nbytes])
+            self.__rx[:len(data)] = b''
+            return data
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        if self.loop:
+            self.inject(data)
+        else:
+            self.tx.extend(data)
+        return len(data)
+
+    def close(self):
+        self.__callback = None
+
+
+class LoopbackBackend(object):
+    """In-memory stand-in for `UartBackend`, the opened port is kept in `port`."""
+
+    def __init__(self, loop=True):
+        self.loop = loop
+        self.port = None
+
+    def open(self, *args, **kwargs):
+        self.port = LoopbackPort(loop=self.loop)
+        return self.port
 
 
 class Serial(object):
@@ -21,7 +109,20 @@ class Serial(object):
     class TimeoutError(Exception):
         pass
 
-    def __init__(self, port=2, baudrate=115200, bytesize=8, parity=0, stopbits=1, flowctl=0, rs485_config=None):
+    # back-off (ms) when the UART driver takes no bytes of a buffered write
+    TX_RETRY_MS = 5
+
+    def __init__(self, port=2, baudrate=115200, bytesize=8, parity=0, stopbits=1, flowctl=0, rs485_config=None,
+                 tx_buffer_size=0, tx_high_water=None, tx_low_water=None, rx_signal=None, backend=None):
+        """
+        @tx_buffer_size: > 0 enables the buffered writer, `write` then only enqueues into a ring of this size and a
+        drainer thread writes to the UART, coalescing small writes queued while it was busy.
+        @tx_high_water: writers block once this many bytes are pending (default: 3/4 of the ring)...
+        @tx_low_water: ...until the drainer brings it down to this level (default: 1/4 of the ring).
+        @rx_signal: `SpscSignal` posted on RX events, pass a shared `MpscSignal` to service several ports from one
+        thread.
+        @backend: object opening the port, see `UartBackend` (default) and `LoopbackBackend`.
+        """
         self.__port = port
         self.__baudrate = baudrate
         self.__bytesize = bytesize
@@ -29,11 +130,26 @@ class Serial(object):
         self.__stopbits = stopbits
         self.__flowctl = flowctl
         self.__rs485_config = rs485_config
+        self.__backend = backend or UartBackend()
 
         self.__uart = None
-        self.__r_cond = Condition()
+        # the UART callback only posts the signal, readers are serialized by the read lock.
+        self.__rx_signal = rx_signal or SpscSignal()
+        self.__r_lock = Lock()
         self.__w_cond = Lock()
 
+        self.__tx_ring = None
+        self.__tx_cond = Condition()
+        self.__tx_thread = None
+        self.__tx_inflight = False
+        self.__tx_throttled = False
+        if tx_buffer_size > 0:
+            self.__tx_ring = RingBuffer(tx_buffer_size)
+            self.__tx_high_water = tx_high_water or tx_buffer_size * 3 // 4
+            self.__tx_low_water = tx_low_water if tx_low_water is not None else tx_buffer_size // 4
+            self.__tx_thread = Thread(target=self.__tx_thread_worker)
+        self.tx_dropped = 0
+
     def __repr__(self):
         return '<UART{},{},{},{},{},{},{}>'.format(
             self.__port, self.__baudrate, self.__bytesize,
@@ -48,36 +164,196 @@ class Serial(object):
         return self.__uart
 
     def open(self):
-        self.__uart = UART(
-            getattr(UART, 'UART{}'.format(self.__port)),
+        self.__uart = self.__backend.open(
+            self.__port,
             self.__baudrate,
             self.__bytesize,
             self.__parity,
             self.__stopbits,
-            self.__flowctl
+            self.__flowctl,
+            rs485_config=self.__rs485_config
         )
-        if isinstance(self.__rs485_config, dict):
-            gpio_num = getattr(UART, "GPIO{}".format(self.__rs485_config['gpio_num']))
-            direction = self.__rs485_config['direction']
-            self.__uart.control_485(gpio_num, direction)
-
         self.__uart.set_callback(self.__uart_cb)
+        if self.__tx_thread is not None:
+            self.__tx_thread.start()
 
     def close(self):
+        if self.__tx_thread is not None:
+            self.__tx_thread.stop()
+            with self.__tx_cond:
+                self.__tx_ring.clear()
+                self.__tx_inflight = False
+                self.__tx_throttled = False
+                self.__tx_cond.notify_all()
         self.__uart.close()
         self.__uart = None
 
     def __uart_cb(self, _):
-        with self.__r_cond:
-            self.__r_cond.notify_all()
+        # driver callback context: never block here
+        self.__rx_signal.post()
 
-    def write(self, data):
-        with self.__w_cond:
-            return self.uart.write(data)
+    def write(self, data, timeout=None):
+        """write `data`, returns the number of bytes written (buffered mode: enqueued).
 
-    def read(self, size, timeout=None):
-        with self.__r_cond:
-            if self.__r_cond.wait_for(lambda: self.uart.any() != 0, timeout=timeout):
-                return self.uart.read(min(size, self.uart.any()))
-            else:
+        In buffered mode this only blocks while the ring is above the high-water mark, `timeout` (s) bounds the whole
+        call and `timeout=0` never blocks, so fewer bytes than `len(data)` may be accepted.
+        """
+        if self.__tx_ring is None:
+            with self.__w_cond:
+                return self.uart.write(data)
+        if isinstance(data, str):
+            # the UART driver takes str as well, keep accepting it when buffered
+            data = data.encode()
+        view = memoryview(data)
+        total = len(view)
+        written = 0
+        deadline = None if timeout is None else utime.ticks_add(utime.ticks_ms(), int(timeout * 1000))
+        with self.__tx_cond:
+            while written < total:
+                if self.__tx_throttled or self.__tx_ring.free() == 0:
+                    remaining = None if deadline is None else utime.ticks_diff(deadline, utime.ticks_ms()) / 1000
+                    if (remaining is not None and remaining <= 0) or not self.__tx_cond.wait_for(
+                            lambda: not self.__tx_throttled and self.__tx_ring.free() > 0, timeout=remaining):
+                        break
+                written += self.__tx_ring.write(view[written:])
+                if len(self.__tx_ring) >= self.__tx_high_water:
+                    self.__tx_throttled = True
+                self.__tx_cond.notify_all()
+        return written
+
+    def flush(self, timeout=None):
+        """wait until every buffered byte has been handed to the UART driver, returns False on timeout."""
+        if self.__tx_ring is None:
+            return True
+        with self.__tx_cond:
+            return self.__tx_cond.wait_for(
+                lambda: len(self.__tx_ring) == 0 and not self.__tx_inflight, timeout=timeout
+            )
+
+    def tx_pending(self):
+        """number of bytes waiting in the buffered writer ring."""
+        if self.__tx_ring is None:
+            return 0
+        with self.__tx_cond:
+            return len(self.__tx_ring)
+
+    def __tx_thread_worker(self):
+        while True:
+            with self.__tx_cond:
+                self.__tx_cond.wait_for(lambda: len(self.__tx_ring) != 0)
+                chunk = self.__tx_ring.peek()
+                self.__tx_inflight = True
+            # the ring lock is not held while transmitting, writes queued meanwhile go out in the next chunk.
+            try:
+                with self.__w_cond:
+                    size = self.uart.write(chunk)
+            except Exception as e:
+                logger.error('write error:', self, e, key='write')
+                size = None
+            with self.__tx_cond:
+                if size is None or size < 0:
+                    self.tx_dropped += len(chunk)
+                    size = len(chunk)
+                self.__tx_ring.consume(size)
+                self.__tx_inflight = False
+                if self.__tx_throttled and len(self.__tx_ring) <= self.__tx_low_water:
+                    self.__tx_throttled = False
+                self.__tx_cond.notify_all()
+            if size == 0:
+                # driver FIFO full, retry the same chunk shortly
+                utime.sleep_ms(self.TX_RETRY_MS)
+
+    def __wait_readable(self, timeout):
+        """returns the number of bytes available, blocking until there is at least one. caller holds the read lock.
+
+        timeout None blocks forever, 0 polls once.
+        """
+        size = self.uart.any()
+        if size:
+            return size
+        deadline = None if timeout is None else utime.ticks_add(utime.ticks_ms(), int(timeout * 1000))
+        while True:
+            remaining = None if deadline is None else utime.ticks_diff(deadline, utime.ticks_ms()) / 1000
+            if remaining is not None and remaining <= 0:
                 raise self.TimeoutError('serial read timeout.')
+            self.__rx_signal.wait(remaining)
+            size = self.uart.any()
+            if size:
+                return size
+
+    def read(self, size, timeout=None):
+        with self.__r_lock:
+            return self.uart.read(min(size, self.__wait_readable(timeout)))
+
+    def readinto(self, buf, nbytes=None, timeout=None):
+        """read into `buf` without allocating, returns the number of bytes read."""
+        if nbytes is None:
+            nbytes = len(buf)
+        with self.__r_lock:
+            size = min(nbytes, self.__wait_readable(timeout))
+            if hasattr(self.uart, 'readinto'):
+                return self.uart.readinto(buf, size)
+            # firmware without UART.readinto
+            data = self.uart.read(size)
+            buf[:len(data)] = data
+            return len(data)
+
+
+def idle_gap_ms(baudrate, bytesize=8, parity=0, stopbits=1, chars=3.5):
+    """line idle time of `chars` character times in ms (rounded up), fixed to 1.75ms above 19200 baud as Modbus
+    requires."""
+    if baudrate > 19200:
+        return 2
+    bits = 1 + bytesize + (1 if parity else 0) + stopbits
+    return int(chars * bits * 1000 / baudrate) + 1
+
+
+class IdleGapDecoder(FrameDecoder):
+    """Frames separated by line idle time (e.g. Modbus RTU t3.5).
+
+    A frame is complete when no byte arrived for `gap_ms`. Detection relies on the reader timing, so it is only as
+    accurate as the thread scheduling and the driver RX buffering allow.
+    """
+
+    def __init__(self, gap_ms=4, max_size=256, copy=True):
+        super().__init__(max_size=max_size, copy=copy)
+        self.gap_ms = gap_ms
+        self.__last = utime.ticks_ms()
+        self.__overflow = False
+
+    @classmethod
+    def for_serial(cls, baudrate, bytesize=8, parity=0, stopbits=1, chars=3.5, **kwargs):
+        """decoder with a gap of `chars` character times, see `idle_gap_ms`."""
+        return cls(gap_ms=idle_gap_ms(baudrate, bytesize, parity, stopbits, chars=chars), **kwargs)
+
+    @property
+    def timeout(self):
+        if self.size or self.__overflow:
+            return self.gap_ms / 1000
+        return None
+
+    def reset(self):
+        super().reset()
+        self.__overflow = False
+
+    def expire(self, callback):
+        if utime.ticks_diff(utime.ticks_ms(), self.__last) < self.gap_ms:
+            return 0
+        count = 0
+        if self.__overflow:
+            self.overflows += 1
+            self.__overflow = False
+        elif self.size:
+            self._deliver(callback, self.view[:self.size])
+            count = 1
+        self.size = 0
+        return count
+
+    def feed(self, data, callback):
+        # the reader may have been late, a gap already elapsed means the held bytes are a complete frame.
+        count = self.expire(callback)
+        self.__last = utime.ticks_ms()
+        if not self.__overflow and not self._append(memoryview(data)):
+            self.__overflow = True
+            self.size = 0
+        return count
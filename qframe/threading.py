@@ -75,7 +75,7 @@ class Waiter(object):
             raise RuntimeError('Waiter object can only be used once.')
         self.__gotit = True
         if timeout > 0:
-            self.unlock_timer.start(timeout * 1000, 0, self.__auto_release)
+            self.unlock_timer.start(max(1, int(timeout * 1000)), 0, self.__auto_release)
         self.__lock.acquire()  # block here
         if timeout > 0:
             self.unlock_timer.stop()
@@ -140,9 +140,12 @@ class Condition(object):
         while not result:
             if remaining is not None:
                 if endtime is None:
-                    endtime = utime.time() + remaining
+                    if remaining <= 0:
+                        # `wait` treats a timeout <= 0 as blocking forever
+                        break
+                    endtime = utime.ticks_add(utime.ticks_ms(), int(remaining * 1000))
                 else:
-                    remaining = endtime - utime.time()
+                    remaining = utime.ticks_diff(endtime, utime.ticks_ms()) / 1000
                     if remaining <= 0.0:
                         break
             self.wait(remaining)
@@ -168,6 +171,83 @@ class Condition(object):
         self.notify(n=len(self.__waiters))
 
 
+class SpscSignal(object):
+    """Single-producer/single-consumer wakeup signal.
+
+    `post` never blocks and takes no lock the consumer may hold, so it is safe to call from driver callbacks. Posts
+    made while the consumer is busy collapse into a single wakeup.
+    """
+
+    def __init__(self):
+        self.__posted = 0
+        self.__taken = 0
+        self.__expired = False
+        self.__lock = _thread.allocate_lock()
+        self.__lock.acquire()
+        self.__timer = None
+
+    def __wakeup(self, *args):
+        try:
+            self.__lock.release()
+        except RuntimeError:
+            # already released
+            pass
+
+    def __expire(self, *args):
+        self.__expired = True
+        self.__wakeup()
+
+    def _count(self):
+        self.__posted += 1
+
+    def post(self):
+        """producer side: count one event and wake the consumer."""
+        self._count()
+        self.__wakeup()
+
+    def pending(self):
+        return self.__posted - self.__taken
+
+    def wait(self, timeout=None):
+        """consumer side: block until something was posted, returns the number of posts taken (0 on timeout).
+
+        timeout None blocks forever, <= 0 polls without blocking.
+        """
+        pending = self.__posted - self.__taken
+        if pending or (timeout is not None and timeout <= 0):
+            self.__taken += pending
+            return pending
+        self.__expired = False
+        if timeout is not None:
+            if self.__timer is None:
+                self.__timer = osTimer()
+            self.__timer.start(max(1, int(timeout * 1000)), 0, self.__expire)
+        try:
+            while True:
+                # a stale release from an earlier post lets this return at once, the loop then waits again.
+                self.__lock.acquire()
+                pending = self.__posted - self.__taken
+                if pending or self.__expired:
+                    self.__taken += pending
+                    return pending
+        finally:
+            if timeout is not None:
+                self.__timer.stop()
+
+
+class MpscSignal(SpscSignal):
+    """`SpscSignal` for several producers (e.g. the RX callbacks of several UARTs), posts are counted under a lock
+    only producers take, so the consumer still never blocks them."""
+
+    def __init__(self):
+        super().__init__()
+        self.__count_lock = _thread.allocate_lock()
+
+    def _count(self):
+        with self.__count_lock:
+            super()._count()
+
+
 class Event(object):
 
     def __init__(self):
@@ -251,6 +331,179 @@ class BoundedSemaphore(Semaphore):
             self.__cond.notify(n)
 
 
+class RateLimiter(object):
+    """Token bucket, refills `rate` tokens per second and holds at most `burst` of them (default: one second worth).
+
+    A request for more than `burst` tokens waits for a full bucket and leaves it in debt, later requests wait until
+    the debt is paid back, so the long term rate holds for any request size.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.__lock = Lock()
+        self.__rate = 1
+        self.__burst = 1
+        self.set_rate(rate, burst)
+        self.__tokens = self.__burst
+        self.__stamp = utime.ticks_ms()
+        self.acquired = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.waited_ms = 0
+
+    def set_rate(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError('rate must be greater than 0.')
+        with self.__lock:
+            self.__rate = rate
+            self.__burst = burst or rate
+
+    def __refill(self):
+        now = utime.ticks_ms()
+        elapsed = utime.ticks_diff(now, self.__stamp)
+        if elapsed > 0:
+            self.__tokens = min(self.__burst, self.__tokens + elapsed * self.__rate / 1000)
+            self.__stamp = now
+
+    def __take(self, n):
+        """take `n` tokens, returns 0 on success or the ms to wait for them."""
+        with self.__lock:
+            self.__refill()
+            need = min(n, self.__burst)
+            if self.__tokens >= need:
+                self.__tokens -= n
+                return 0
+            return int((need - self.__tokens) * 1000 / self.__rate) + 1
+
+    def acquire(self, n=1, block=True, timeout=None):
+        """take `n` tokens, waiting for the bucket to refill unless `block` is False.
+        @timeout: max seconds to wait, None waits as long as needed.
+        @return: True if the tokens were taken, False otherwise."""
+        wait = self.__take(n)
+        if not wait:
+            self.acquired += 1
+            return True
+        if not block:
+            self.rejected += 1
+            return False
+        if timeout is not None and timeout <= 0:
+            raise ValueError("'timeout' must be a positive number.")
+        self.throttled += 1
+        start = utime.ticks_ms()
+        deadline = None if timeout is None else utime.ticks_add(start, int(timeout * 1000))
+        while wait:
+            if deadline is not None:
+                remaining = utime.ticks_diff(deadline, utime.ticks_ms())
+                if remaining <= 0:
+                    self.rejected += 1
+                    self.waited_ms += utime.ticks_diff(utime.ticks_ms(), start)
+                    return False
+                wait = min(wait, remaining)
+            utime.sleep_ms(wait)
+            wait = self.__take(n)
+        self.waited_ms += utime.ticks_diff(utime.ticks_ms(), start)
+        self.acquired += 1
+        return True
+
+    def try_acquire(self, n=1):
+        return self.acquire(n, block=False)
+
+    def stats(self):
+        """`throttled` counts acquires that had to wait, `rejected` the ones that gave up without tokens."""
+        with self.__lock:
+            self.__refill()
+            tokens = self.__tokens
+        return {
+            'rate': self.__rate,
+            'burst': self.__burst,
+            'tokens': tokens,
+            'acquired': self.acquired,
+            'throttled': self.throttled,
+            'rejected': self.rejected,
+            'waited_ms': self.waited_ms,
+        }
+
+
+class Backpressure(object):
+    """High/low watermark flow signal from a consumer with a bounded buffer back to its producers.
+
+    The consumer reports its fill level with `update`: the signal pauses when the level reaches `high` and resumes
+    only once it is back down to `low`, so producers do not flap on every message. Producers check `is_paused`,
+    `wait` for the resume or `subscribe` a callback called with the new state (True: paused) on every change.
+    Callbacks run in the consumer, possibly with its locks held: they must not block nor call back into it.
+    """
+
+    def __init__(self, high, low=None):
+        if low is None:
+            low = high // 2
+        if not 0 <= low < high:
+            raise ValueError('low watermark must be >= 0 and below the high watermark.')
+        self.high = high
+        self.low = low
+        self.level = 0
+        self.max_level = 0
+        self.pauses = 0
+        self.paused_ms = 0
+        self.__paused_at = None
+        self.__resumed = Event()
+        self.__resumed.set()
+        self.__callbacks = []
+        self.__lock = Lock()
+
+    def subscribe(self, callback):
+        self.__callbacks.append(callback)
+
+    def unsubscribe(self, callback):
+        try:
+            self.__callbacks.remove(callback)
+        except ValueError:
+            pass
+
+    def update(self, level):
+        changed = None
+        with self.__lock:
+            self.level = level
+            if level > self.max_level:
+                self.max_level = level
+            if self.__paused_at is None and level >= self.high:
+                self.__paused_at = utime.ticks_ms()
+                self.pauses += 1
+                self.__resumed.clear()
+                changed = True
+            elif self.__paused_at is not None and level <= self.low:
+                self.paused_ms += utime.ticks_diff(utime.ticks_ms(), self.__paused_at)
+                self.__paused_at = None
+                self.__resumed.set()
+                changed = False
+        if changed is not None:
+            for callback in self.__callbacks:
+                try:
+                    callback(changed)
+                except Exception as e:
+                    usys.print_exception(e)
+
+    def is_paused(self):
+        return self.__paused_at is not None
+
+    def wait(self, timeout=None):
+        """wait until not paused, returns False on timeout."""
+        return self.__resumed.wait(timeout=timeout)
+
+    def stats(self):
+        with self.__lock:
+            paused_ms = self.paused_ms
+            if self.__paused_at is not None:
+                paused_ms += utime.ticks_diff(utime.ticks_ms(), self.__paused_at)
+            return {
+                'paused': self.__paused_at is not None,
+                'level': self.level,
+                'max_level': self.max_level,
+                'high': self.high,
+                'low': self.low,
+                'pauses': self.pauses,
+                'paused_ms': paused_ms,
+            }
+
+
 class Queue(object):
 
     class Full(Exception):
@@ -477,19 +730,40 @@ def _worker(work_queue):
 
 class ThreadPoolExecutor(object):
 
-    def __init__(self, max_workers=4, enable_priority=False):
+    class Throttled(Exception):
+        pass
+
+    def __init__(self, max_workers=4, enable_priority=False, rate_limits=None):
+        """@rate_limits: {task name: `set_rate_limit` options}, e.g. {'uart.main': {'rate': 20, 'timeout': 0}}."""
         if max_workers <= 0:
             raise ValueError('max_workers must be greater than 0.')
         self.__max_workers = max_workers
         self.__work_queue = PriorityQueue() if enable_priority else Queue()
         self.__threads = set()
         self.__lock = Lock()
+        self.__limits = {}
+        for name, options in (rate_limits or {}).items():
+            self.set_rate_limit(name, **options)
+
+    def set_rate_limit(self, name, rate=None, burst=None, timeout=None):
+        """limit submissions of tasks named `name` to `rate` per second, None removes the limit.
+        @timeout: seconds `submit` waits for the limiter before raising `Throttled`, None waits as long as needed
+        and 0 does not wait at all."""
+        if rate is None:
+            self.__limits.pop(name, None)
+        else:
+            self.__limits[name] = (RateLimiter(rate, burst), timeout)
 
     def submit(self, *args, **kwargs):
         if len(args) == 1 and isinstance(args[0], Task):
             task = args[0]
         else:
             task = Task(**kwargs)
+        limit = self.__limits.get(task.name)
+        if limit is not None:
+            limiter, timeout = limit
+            if not limiter.acquire(block=timeout != 0, timeout=timeout):
+                raise self.Throttled('task "{}" over its rate limit'.format(task.name))
         self.__work_queue.put(task)
         self.__adjust_thread_count()
         return task.result
@@ -501,6 +775,9 @@ class ThreadPoolExecutor(object):
                 t.start()
                 self.__threads.add(t)
 
+    def rate_stats(self):
+        return {name: limit[0].stats() for name, limit in self.__limits.items()}
+
     def shutdown(self):
         with self.__lock:
             for t in self.__threads:
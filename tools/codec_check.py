@@ -0,0 +1,95 @@
+# Copyright (c) Quectel Wireless Solution, Co., Ltd.All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Host checks of the `qframe.codecs` decoders: fragmenting a stream must not change the frames decoded from it.
+
+Feeds random streams (including oversized frames) whole and cut at random points and compares the results, plus
+fixed regression cases.
+
+usage: python tools/codec_check.py --trials 2000 --seed 1
+"""
+
+import os
+import sys
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import hostcompat  # noqa: E402
+
+
+# (decoder options, fragments, expected frames)
+REGRESSIONS = [
+    # delimiter split across fragments while an oversized frame is discarded
+    ({'type': 'delimiter', 'max_size': 4}, [b'defgh', b'ij\r', b'\nxy\r\n'], [b'xy']),
+    ({'type': 'delimiter', 'max_size': 4}, [b'defgh', b'ij', b'\r\nxy\r\n'], [b'xy']),
+    # frame of exactly `max_size` bytes followed by a split delimiter
+    ({'type': 'delimiter', 'max_size': 4}, [b'abcd\r', b'\n'], [b'abcd']),
+    ({'type': 'delimiter', 'delimiter': b'<>!', 'max_size': 4}, [b'x', b'abcd<', b'>!y<>!'], [b'y']),
+]
+
+
+def decode(options, fragments):
+    from qframe.codecs import make_decoder
+    decoder = make_decoder(**options)
+    frames = []
+    for fragment in fragments:
+        decoder.feed(fragment, frames.append)
+    return frames
+
+
+def random_case(rng):
+    if rng.random() < 0.5:
+        delimiter = rng.choice([b'\r\n', b'|', b'<>!'])
+        options = {'type': 'delimiter', 'delimiter': delimiter, 'strip': rng.random() < 0.5, 'max_size': 4}
+        frames = [bytes(rng.choice(b'abcdefg') for _ in range(rng.randint(0, 8))) for _ in range(6)]
+        data = delimiter.join(frames) + delimiter
+    else:
+        options = {'type': 'length', 'length_size': 2, 'max_size': 8}
+        data = b''
+        for _ in range(6):
+            payload = bytes(rng.randint(0, 255) for _ in range(rng.randint(0, 4)))
+            data += (2 + len(payload)).to_bytes(2, 'big') + payload
+    cuts = sorted(rng.sample(range(1, len(data)), min(len(data) - 1, rng.randint(1, 6))))
+    fragments = [data[a:b] for a, b in zip([0] + cuts, cuts + [len(data)])]
+    return options, data, fragments
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='check QFrame frame decoders against fragmentation.')
+    parser.add_argument('--trials', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    hostcompat.install()
+    failures = 0
+    for options, fragments, expected in REGRESSIONS:
+        got = decode(options, fragments)
+        if got != expected:
+            failures += 1
+            print('FAIL {} {!r}: {!r} != {!r}'.format(options, fragments, got, expected))
+    rng = random.Random(args.seed)
+    for _ in range(args.trials):
+        options, data, fragments = random_case(rng)
+        whole = decode(options, [data])
+        got = decode(options, fragments)
+        if got != whole:
+            failures += 1
+            print('FAIL {} {!r}: {!r} != {!r}'.format(options, fragments, got, whole))
+    print('{} regression cases, {} random trials, {} failures'.format(len(REGRESSIONS), args.trials, failures))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,254 @@
+# Copyright (c) Quectel Wireless Solution, Co., Ltd.All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run QFrame modules on a Linux host (CPython) for benchmarks and off-device checks.
+
+`install()` registers host versions of the QuecPython modules used by the framework core (`utime`, `osTimer`,
+`_thread` extensions, `ql_fs`, `ussl`, `uzlib`, ...) and loads the `qframe` package without executing its `__init__`, which pulls
+in device-only extensions (sms, sim, dataCall...). Only the platform-neutral modules can be imported afterwards:
+`qframe.serial`, `qframe.threading`, `qframe.collections`, `qframe.logging`, `qframe.builtins.uart`...
+
+WARNING: `Thread.stop` cannot kill a host thread, it only marks it as stopped.
+"""
+
+import os
+import sys
+import json
+import time
+import types
+import threading
+import _thread as _host_thread
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _utime():
+    mod = types.ModuleType('utime')
+    mod.time = lambda: int(time.time())
+    mod.localtime = lambda secs=None: time.localtime(secs)[:8]
+    mod.mktime = lambda t: int(time.mktime(tuple(t[:8]) + (-1,)))
+    mod.ticks_ms = lambda: int(time.monotonic() * 1000)
+    mod.ticks_us = lambda: int(time.monotonic() * 1000000)
+    mod.ticks_diff = lambda end, start: end - start
+    mod.ticks_add = lambda ticks, delta: ticks + delta
+    mod.sleep = time.sleep
+    mod.sleep_ms = lambda ms: time.sleep(ms / 1000)
+    mod.sleep_us = lambda us: time.sleep(us / 1000000)
+    mod.getTimeZone = lambda: -time.timezone // 3600
+    mod.setTimeZone = lambda offset: 0
+    return mod
+
+
+def _thread_module():
+    mod = types.ModuleType('_thread')
+    for name in dir(_host_thread):
+        if not name.startswith('__'):
+            setattr(mod, name, getattr(_host_thread, name))
+    running = set()
+
+    def start_new_thread(fn, args, kwargs=None):
+        started = threading.Event()
+
+        def run():
+            running.add(threading.get_ident())
+            started.set()
+            try:
+                fn(*args, **(kwargs or {}))
+            finally:
+                running.discard(threading.get_ident())
+
+        t = threading.Thread(target=run, daemon=True)
+        t.start()
+        started.wait()
+        return t.ident
+
+    mod.start_new_thread = start_new_thread
+    mod.threadIsRunning = lambda ident: ident in running
+    mod.stop_thread = lambda ident: running.discard(ident)
+    return mod
+
+
+class osTimer(object):
+    """host `osTimer`, one-shot and periodic timers on `threading.Timer`."""
+
+    def __init__(self):
+        self.__timer = None
+        self.__lock = threading.Lock()
+
+    def start(self, period, periodic, callback):
+        self.stop()
+
+        def fire():
+            if periodic:
+                self.start(period, periodic, callback)
+            callback(None)
+
+        with self.__lock:
+            self.__timer = threading.Timer(period / 1000, fire)
+            self.__timer.daemon = True
+            self.__timer.start()
+        return 0
+
+    def stop(self):
+        with self.__lock:
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+        return 0
+
+
+def _ql_fs():
+    mod = types.ModuleType('ql_fs')
+    mod.path_exists = os.path.exists
+
+    def read_json(path):
+        with open(path) as f:
+            return json.load(f)
+
+    def touch(path, data):
+        with open(path, 'w') as f:
+            json.dump(data, f)
+        return 0
+
+    def mkdirs(path):
+        os.makedirs(path, exist_ok=True)
+
+    mod.read_json = read_json
+    mod.touch = touch
+    mod.mkdirs = mkdirs
+    return mod
+
+
+def _ussl():
+    """`ussl.wrap_socket` on CPython `ssl`, certificates are PEM contents like on the device. Also accepts the
+    `session` argument and exposes `session` / `session_reused` on the returned socket."""
+    import ssl
+    import tempfile
+    mod = types.ModuleType('ussl')
+    mod.CERT_NONE = ssl.CERT_NONE
+    mod.CERT_OPTIONAL = ssl.CERT_OPTIONAL
+    mod.CERT_REQUIRED = ssl.CERT_REQUIRED
+    contexts = {}
+
+    def context(server_side, keyfile, certfile, cert_reqs, ca_certs):
+        key = (server_side, keyfile, certfile, cert_reqs, ca_certs)
+        if key not in contexts:
+            ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER if server_side else ssl.PROTOCOL_TLS_CLIENT)
+            ctx.check_hostname = False
+            ctx.verify_mode = cert_reqs
+            if ca_certs:
+                ctx.load_verify_locations(cadata=ca_certs)
+            if certfile:
+                with tempfile.NamedTemporaryFile('w', suffix='.pem', delete=False) as f:
+                    f.write(certfile + '\n' + (keyfile or ''))
+                ctx.load_cert_chain(f.name)
+                os.unlink(f.name)
+            contexts[key] = ctx
+        return contexts[key]
+
+    def wrap_socket(sock, server_side=False, keyfile=None, certfile=None, cert_reqs=ssl.CERT_NONE, ca_certs=None,
+                    server_hostname=None, session=None):
+        ctx = context(server_side, keyfile, certfile, cert_reqs, ca_certs)
+        return ctx.wrap_socket(sock, server_side=server_side, server_hostname=server_hostname, session=session)
+
+    mod.wrap_socket = wrap_socket
+    return mod
+
+
+def _uzlib():
+    """`uzlib.DecompIO` / `uzlib.decompress` on CPython `zlib`."""
+    import zlib
+    mod = types.ModuleType('uzlib')
+
+    class DecompIO(object):
+
+        def __init__(self, stream, wbits=0, *args):
+            self.__stream = stream
+            self.__inflater = zlib.decompressobj(wbits or 15)
+            self.__buffer = b''
+
+        def read(self, size=-1):
+            if size is None or size < 0 or len(self.__buffer) < size:
+                self.__buffer += self.__inflater.decompress(self.__stream.read()) + self.__inflater.flush()
+            if size is None or size < 0:
+                size = len(self.__buffer)
+            data, self.__buffer = self.__buffer[:size], self.__buffer[size:]
+            return data
+
+    mod.DecompIO = DecompIO
+    mod.decompress = lambda data, wbits=15, *args: zlib.decompress(data, wbits)
+    return mod
+
+
+def _package(name, path):
+    mod = types.ModuleType(name)
+    mod.__path__ = [path]
+    sys.modules[name] = mod
+    return mod
+
+
+def install(root=ROOT):
+    """register host modules and load `qframe` from `root`, returns the `qframe` package."""
+    if 'qframe' in sys.modules:
+        return sys.modules['qframe']
+    import io
+    import json as ujson
+    import struct
+    import random
+    import select
+    import socket
+    import binascii
+    aliases = {
+        'usys': sys, 'uio': io, 'ustruct': struct, 'ujson': ujson, 'urandom': random,
+        'uselect': select, 'usocket': socket, 'ubinascii': binascii, 'uos': os,
+    }
+    for name, mod in aliases.items():
+        sys.modules.setdefault(name, mod)
+    sys.modules['utime'] = _utime()
+    sys.modules['_thread'] = _thread_module()
+    sys.modules['osTimer'] = osTimer
+    sys.modules['ql_fs'] = _ql_fs()
+    sys.modules['ussl'] = _ussl()
+    sys.modules['uzlib'] = _uzlib()
+
+    qframe = _package('qframe', os.path.join(root, 'qframe'))
+    # core is platform neutral, extensions only need `AppExtensionABC` from the package
+    from qframe import core
+    qframe.Application = core.Application
+    qframe.AppExtensionABC = core.AppExtensionABC
+    qframe.CurrentApp = core.CurrentApp
+    qframe.G = core.G
+    _package('qframe.builtins', os.path.join(root, 'qframe', 'builtins'))
+    return qframe
+
+
+class HostApp(object):
+    """minimal application stand-in for driving extensions, `config` is a plain dict."""
+
+    def __init__(self, config=None):
+        self.config = config or {}
+        self.extensions = {}
+
+    def __getattr__(self, item):
+        try:
+            return self.extensions[item]
+        except KeyError:
+            raise AttributeError(item)
+
+    def append_extension(self, extension):
+        self.extensions[extension.name] = extension
+
+    def submit(self, target=None, args=(), kwargs=None, **_):
+        threading.Thread(target=target, args=args, kwargs=kwargs or {}, daemon=True).start()
@@ -0,0 +1,132 @@
+# Copyright (c) Quectel Wireless Solution, Co., Ltd.All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Host checks of the `qframe.logging` message throttling and binary output.
+
+Logs a burst of repeated messages that is never followed by the same message again and checks that the number of
+suppressed ones is still reported, by a later call once the interval passed or when the entry is evicted. Then
+writes print-style records in binary mode and checks that `tools/logdecode.py` rebuilds them and that the repeated
+format string and text argument are interned.
+
+usage: python tools/log_check.py
+"""
+
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import hostcompat  # noqa: E402
+
+
+INTERVAL = 0.1
+
+
+def lines(stream):
+    return [line.split('] ', 1)[1] for line in stream.getvalue().splitlines()]
+
+
+def burst(logger, count, key=None):
+    for _ in range(count):
+        logger.warn('link', 'down', key=key)
+
+
+def check_interval(logger):
+    """burst ends, a different message after the interval reports it."""
+    burst(logger, 5)
+    time.sleep(INTERVAL * 1.5)
+    logger.warn('other')
+    return ['link down', 'message repeated 4 times: link down', 'other']
+
+
+def check_within_interval(logger):
+    """a different message within the interval does not report the burst yet."""
+    burst(logger, 3)
+    logger.warn('other')
+    return ['link down', 'other']
+
+
+def check_key(logger):
+    """messages throttled by key are reported under that key."""
+    burst(logger, 4, key='link')
+    time.sleep(INTERVAL * 1.5)
+    logger.warn('other')
+    return ['link down', 'message repeated 3 times: link', 'other']
+
+
+def check_same_message(logger):
+    """the same message after the interval reports the count right before it, once."""
+    burst(logger, 3)
+    time.sleep(INTERVAL * 1.5)
+    burst(logger, 1)
+    logger.warn('other')
+    return ['link down', 'message repeated 2 times', 'link down', 'other']
+
+
+def check_eviction(logger):
+    """an entry evicted within its interval reports its count."""
+    logger.max_throttle_keys = 2
+    burst(logger, 3)
+    logger.warn('a')
+    logger.warn('b')
+    return ['link down', 'a', 'message repeated 2 times: link down', 'b']
+
+
+def check_binary():
+    from qframe.logging import BasicConfig, Logger
+    import logdecode
+    stream = io.BytesIO()
+    BasicConfig.update(stream=stream, binary=True)
+    BasicConfig.encoder = None
+    logger = Logger('check_binary')
+    logger.setDedup(0)
+    peer = 'TcpSocket(host="10.0.0.1",port=8080)'
+    for code in range(100):
+        logger.warn('read error:', peer, OSError(code), key='read')
+    BasicConfig.update(stream=sys.stdout, binary=False)
+    data = stream.getvalue()
+    got = [line.split('] ', 1)[1] for line in logdecode.decode(data)]
+    errors = []
+    if got != ['read error: {} {}'.format(peer, code) for code in range(100)]:
+        errors.append('decoded {!r}'.format(got[:3]))
+    # per record: log header, the peer reference and the short error text inline
+    if len(data) > 100 * (12 + 3 + 5) + 100:
+        errors.append('{} bytes'.format(len(data)))
+    print('check_binary: {}'.format('ok' if not errors else 'FAIL ' + '; '.join(errors)))
+    return len(errors)
+
+
+def main():
+    hostcompat.install()
+    from qframe.logging import BasicConfig, Logger
+    failures = 0
+    checks = [check_interval, check_within_interval, check_key, check_same_message, check_eviction]
+    for check in checks:
+        stream = io.StringIO()
+        BasicConfig.update(stream=stream, binary=False)
+        logger = Logger(check.__name__)
+        logger.setDedup(INTERVAL)
+        expected = check(logger)
+        got = lines(stream)
+        ok = got == expected
+        if not ok:
+            failures += 1
+        print('{}: {}'.format(check.__name__, 'ok' if ok else 'FAIL {!r}'.format(got)))
+    failures += check_binary()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
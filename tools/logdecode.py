@@ -0,0 +1,158 @@
+# Copyright (c) Quectel Wireless Solution, Co., Ltd.All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Host side decoder for binary logs written by `qframe.logging` (BasicConfig binary mode).
+
+usage: python tools/logdecode.py log.bin [log.bin ...]
+"""
+
+import sys
+import time
+import struct
+import argparse
+
+
+MAGIC = b'QLOG'
+VERSION = 2
+# version 1 streams lack the interned argument tag and decode the same way
+VERSIONS = (1, 2)
+
+REC_HEADER = 0x00
+REC_DEFINE = 0x01
+REC_LOG = 0x02
+
+LEVEL_RAW = 0xFF
+NO_FORMAT = 0xFFFF
+
+HEADER_FORMAT = '<4sBi'
+DEFINE_FORMAT = '<HH'
+LOG_FORMAT = '<IBHHB'
+
+LEVEL_NAMES = {
+    0: 'DEBUG',
+    1: 'INFO',
+    2: 'WARN',
+    3: 'ERROR',
+    4: 'CRITICAL',
+}
+
+
+class DecodeError(Exception):
+    pass
+
+
+class Reader(object):
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def eof(self):
+        return self.pos >= len(self.data)
+
+    def take(self, size):
+        if self.pos + size > len(self.data):
+            raise DecodeError('truncated record at offset {}'.format(self.pos))
+        rv = self.data[self.pos:self.pos + size]
+        self.pos += size
+        return rv
+
+    def unpack(self, fmt):
+        return struct.unpack(fmt, self.take(struct.calcsize(fmt)))
+
+
+def format_float(value):
+    # device floats are single precision, keep the digits a device `print` would show.
+    return repr(float('{:.7g}'.format(value)))
+
+
+def decode_arg(reader, strings):
+    tag = reader.take(1)
+    if tag == b'n':
+        return 'None'
+    if tag == b'T':
+        return 'True'
+    if tag == b'F':
+        return 'False'
+    if tag == b'i':
+        return str(reader.unpack('<i')[0])
+    if tag == b'f':
+        return format_float(reader.unpack('<f')[0])
+    if tag == b'r':
+        ident, = reader.unpack('<H')
+        return strings.get(ident, '<str#{}>'.format(ident))
+    if tag in (b's', b'b'):
+        size, = reader.unpack('<H')
+        data = reader.take(size)
+        if tag == b'b':
+            return repr(data)
+        return data.decode('utf-8', 'replace')
+    raise DecodeError('unknown argument tag {!r} at offset {}'.format(tag, reader.pos - 1))
+
+
+def format_time(timestamp, offset):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(timestamp + offset))
+
+
+def decode(data):
+    """yield text lines rebuilt from a binary log stream."""
+    reader = Reader(data)
+    strings = {}
+    offset = 0
+    while not reader.eof():
+        rec_type, = reader.unpack('<B')
+        if rec_type == REC_HEADER:
+            magic, version, offset = reader.unpack(HEADER_FORMAT)
+            if magic != MAGIC or version not in VERSIONS:
+                raise DecodeError('bad header at offset {}'.format(reader.pos))
+            # a new header means the device restarted the encoder, ids start over.
+            strings = {}
+        elif rec_type == REC_DEFINE:
+            ident, size = reader.unpack(DEFINE_FORMAT)
+            strings[ident] = reader.take(size).decode('utf-8', 'replace')
+        elif rec_type == REC_LOG:
+            timestamp, level, logger_id, fmt_id, nargs = reader.unpack(LOG_FORMAT)
+            items = [] if fmt_id == NO_FORMAT else [strings.get(fmt_id, '<fmt#{}>'.format(fmt_id))]
+            items.extend(decode_arg(reader, strings) for _ in range(nargs))
+            if level == LEVEL_RAW:
+                yield ' '.join(items)
+                continue
+            prefix = '[{}][{}][{}]'.format(
+                format_time(timestamp, offset),
+                strings.get(logger_id, '<logger#{}>'.format(logger_id)),
+                LEVEL_NAMES.get(level, str(level))
+            )
+            yield ' '.join([prefix] + items)
+        else:
+            raise DecodeError('unknown record type {} at offset {}'.format(rec_type, reader.pos - 1))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='decode QFrame binary log files into text.')
+    parser.add_argument('files', nargs='+', help='binary log files')
+    args = parser.parse_args(argv)
+    for path in args.files:
+        with open(path, 'rb') as f:
+            data = f.read()
+        try:
+            for line in decode(data):
+                print(line)
+        except DecodeError as e:
+            print('{}: {}'.format(path, e), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
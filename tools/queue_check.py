@@ -0,0 +1,114 @@
+# Copyright (c) Quectel Wireless Solution, Co., Ltd.All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Host checks of `qframe.collections.PersistentQueue` recovery from damaged segments.
+
+Writes records, damages the segment file on disk, reopens the queue and checks that every intact record is read
+back in order, the damaged ones are counted once in `corrupt_records` and nothing is left pending.
+
+usage: python tools/queue_check.py
+"""
+
+import os
+import sys
+import random
+import shutil
+import binascii
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import hostcompat  # noqa: E402
+
+
+RECORDS = [('rec{}'.format(i) * 5).encode() for i in range(6)]
+RECORD_SIZE = 7 + len(RECORDS[0])
+
+
+def flip(offset):
+    def damage(data):
+        data[offset] ^= 0xFF
+    return damage
+
+
+def truncate(size):
+    def damage(data):
+        del data[size:]
+    return damage
+
+
+# (name, damages, indexes of the records expected back, corrupt records expected)
+CASES = [
+    ('payload', [flip(RECORD_SIZE + 10)], [0, 2, 3, 4, 5], 1),
+    ('payload and length', [flip(RECORD_SIZE + 10), flip(3 * RECORD_SIZE + 1)], [0, 2, 4, 5], 2),
+    ('magic', [flip(2 * RECORD_SIZE)], [0, 1, 3, 4, 5], 1),
+    ('torn tail', [truncate(5 * RECORD_SIZE + 3)], [0, 1, 2, 3, 4], 1),
+]
+
+
+def check(name, damages, expected, corrupt):
+    from qframe.collections import PersistentQueue
+    path = tempfile.mkdtemp()
+    try:
+        queue = PersistentQueue(path)
+        for record in RECORDS:
+            queue.put(record)
+        queue.close()
+        segment = os.path.join(path, '00000000.seg')
+        with open(segment, 'rb') as f:
+            data = bytearray(f.read())
+        for damage in damages:
+            damage(data)
+        with open(segment, 'wb') as f:
+            f.write(data)
+        queue = PersistentQueue(path)
+        pending = len(queue)
+        got = []
+        while True:
+            record = queue.get()
+            if record is None:
+                break
+            got.append(record)
+        errors = []
+        if got != [RECORDS[i] for i in expected]:
+            errors.append('records {!r}'.format([r[:4] for r in got]))
+        if pending != len(expected):
+            errors.append('{} pending on open'.format(pending))
+        if queue.corrupt_records != corrupt:
+            errors.append('corrupt_records {} != {}'.format(queue.corrupt_records, corrupt))
+        if len(queue):
+            errors.append('{} left pending'.format(len(queue)))
+        queue.close()
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+    print('{}: {}'.format(name, 'ok' if not errors else 'FAIL ' + '; '.join(errors)))
+    return len(errors)
+
+
+def main():
+    hostcompat.install()
+    from qframe import collections
+    failures = 0
+    rng = random.Random(1)
+    for _ in range(100):
+        data = bytes(rng.randint(0, 255) for _ in range(rng.randint(0, 300)))
+        if collections._soft_crc32(data) != binascii.crc32(data):
+            failures += 1
+    print('soft crc32: {}'.format('ok' if not failures else 'FAIL'))
+    for case in CASES:
+        failures += check(*case)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,250 @@
+# Copyright (c) Quectel Wireless Solution, Co., Ltd.All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Serial hot path benchmark on a Linux host.
+
+Drives `qframe.serial.Serial` (raw reads) or the `Uart` extension (length-prefixed frames through
+`recv_callback`) over an in-memory loopback or a pseudo-terminal paced at the configured baud rate, and reports
+throughput, callback latency percentiles and allocations.
+
+usage: python tools/serial_bench.py --backend pty --mode uart --frame-size 64 --rate 200 --baudrate 115200
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import hostcompat  # noqa: E402
+
+
+def wire_time(size, baudrate, bytesize=8, parity=0, stopbits=1):
+    """seconds needed to transmit `size` bytes."""
+    return size * (1 + bytesize + (1 if parity else 0) + stopbits) / baudrate
+
+
+class PtyPort(object):
+    """Port over the master side of a pty, RX and TX are paced to the line rate."""
+
+    def __init__(self, fd, baudrate, bytesize, parity, stopbits, pace=True):
+        self.__fd = fd
+        self.__char_time = wire_time(1, baudrate, bytesize, parity, stopbits) if pace else 0
+        self.__rx = bytearray()
+        self.__lock = threading.Lock()
+        self.__callback = None
+        self.__tx_free = 0.0
+        self.__closed = False
+        self.__reader = threading.Thread(target=self.__reader_worker, daemon=True)
+        self.__reader.start()
+
+    def __reader_worker(self):
+        line_free = 0.0
+        while not self.__closed:
+            try:
+                data = os.read(self.__fd, 4096)
+            except OSError:
+                break
+            # bytes cannot arrive faster than the line carries them
+            line_free = max(time.monotonic(), line_free) + len(data) * self.__char_time
+            delay = line_free - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            with self.__lock:
+                self.__rx.extend(data)
+            if self.__callback is not None:
+                self.__callback(None)
+
+    def set_callback(self, fn):
+        self.__callback = fn
+
+    def any(self):
+        return len(self.__rx)
+
+    def readinto(self, buf, nbytes=None):
+        with self.__lock:
+            size = min(len(self.__rx), len(buf) if nbytes is None else nbytes)
+            buf[:size] = self.__rx[:size]
+            del self.__rx[:size]
+            return size
+
+    def read(self, nbytes):
+        with self.__lock:
+            data = bytes(self.__rx[:nbytes])
+            del self.__rx[:len(data)]
+            return data
+
+    def write(self, data):
+        self.__tx_free = max(time.monotonic(), self.__tx_free) + len(data) * self.__char_time
+        os.write(self.__fd, data)
+        delay = self.__tx_free - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return len(data)
+
+    def close(self):
+        self.__closed = True
+        self.__callback = None
+
+
+class PtyBackend(object):
+    """Linux pty backend, the peer (device side of the link) uses `peer_fd` or opens `peer_name`."""
+
+    def __init__(self, pace=True):
+        import tty
+        self.pace = pace
+        self.master_fd, self.peer_fd = os.openpty()
+        tty.setraw(self.master_fd)
+        tty.setraw(self.peer_fd)
+        self.peer_name = os.ttyname(self.peer_fd)
+        self.port = None
+
+    def open(self, port, baudrate, bytesize, parity, stopbits, flowctl, rs485_config=None):
+        self.port = PtyPort(self.master_fd, baudrate, bytesize, parity, stopbits, pace=self.pace)
+        return self.port
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class Bench(object):
+
+    def __init__(self, args):
+        self.args = args
+        self.latencies = []
+        self.frames = 0
+        self.bytes = 0
+        self.done = threading.Event()
+
+    def make_frame(self, seq):
+        size = max(self.args.frame_size, 14)
+        payload = time.perf_counter_ns().to_bytes(8, 'big') + seq.to_bytes(4, 'big')
+        payload += bytes(size - 2 - len(payload))
+        return len(payload).to_bytes(2, 'big') + payload
+
+    def on_frame(self, frame):
+        now = time.perf_counter_ns()
+        sent = int.from_bytes(bytes(frame[2:10]), 'big')
+        self.latencies.append((now - sent) / 1e6)
+        self.frames += 1
+        self.bytes += len(frame)
+        if self.frames >= self.args.count:
+            self.done.set()
+
+    def open(self):
+        from qframe.serial import Serial, LoopbackBackend, LengthPrefixDecoder
+        from qframe.builtins.uart import Uart
+        if self.args.backend == 'pty':
+            backend = PtyBackend(pace=not self.args.no_pace)
+            send = lambda data: os.write(backend.peer_fd, data)
+        else:
+            backend = LoopbackBackend(loop=False)
+            send = lambda data: backend.port.inject(data)
+        config = {'port': 0, 'baudrate': self.args.baudrate, 'backend': backend}
+        decoder = LengthPrefixDecoder(max_size=max(self.args.frame_size, 14), copy=not self.args.zero_copy)
+        if self.args.mode == 'uart':
+            bench = self
+
+            class BenchUart(Uart):
+                def recv_callback(self, data):
+                    bench.on_frame(data)
+
+            uart = BenchUart('uart', decoder=decoder, zero_copy=self.args.zero_copy)
+            uart.init_app(hostcompat.HostApp({'UART': config}))
+            uart.load()
+        else:
+            serial = Serial(**config)
+            serial.open()
+
+            def reader():
+                buf = bytearray(1024)
+                view = memoryview(buf)
+                while not self.done.is_set():
+                    try:
+                        if self.args.zero_copy:
+                            decoder.feed(view[:serial.readinto(buf, timeout=1)], self.on_frame)
+                        else:
+                            decoder.feed(serial.read(1024, timeout=1), self.on_frame)
+                    except Serial.TimeoutError:
+                        continue
+
+            threading.Thread(target=reader, daemon=True).start()
+        return send
+
+    def run(self):
+        send = self.open()
+        interval = 1.0 / self.args.rate if self.args.rate > 0 else 0
+        tracemalloc.start()
+        start = time.monotonic()
+        next_send = start
+        for seq in range(self.args.count):
+            send(self.make_frame(seq))
+            if interval:
+                next_send += interval
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+        self.done.wait(timeout=self.args.timeout)
+        elapsed = time.monotonic() - start
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(True, os.path.join(hostcompat.ROOT, 'qframe', '*'))]
+        )
+        tracemalloc.stop()
+        qframe_blocks = sum(stat.count for stat in snapshot.statistics('filename'))
+        return {
+            'backend': self.args.backend,
+            'mode': self.args.mode,
+            'frames': '{}/{}'.format(self.frames, self.args.count),
+            'bytes/s': round(self.bytes / elapsed),
+            'frames/s': round(self.frames / elapsed),
+            'latency p50 (ms)': round(percentile(self.latencies, 50), 3),
+            'latency p90 (ms)': round(percentile(self.latencies, 90), 3),
+            'latency p99 (ms)': round(percentile(self.latencies, 99), 3),
+            'latency max (ms)': round(max(self.latencies or [0]), 3),
+            'traced peak (bytes)': peak,
+            'traced current (bytes)': current,
+            'live qframe blocks': qframe_blocks,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='QFrame serial path benchmark (Linux host).')
+    parser.add_argument('--backend', choices=('loopback', 'pty'), default='loopback')
+    parser.add_argument('--mode', choices=('serial', 'uart'), default='uart')
+    parser.add_argument('--frame-size', type=int, default=64, help='bytes per frame (min 14)')
+    parser.add_argument('--rate', type=float, default=0, help='frames per second, 0 for as fast as possible')
+    parser.add_argument('--count', type=int, default=2000, help='frames to send')
+    parser.add_argument('--baudrate', type=int, default=115200)
+    parser.add_argument('--no-pace', action='store_true', help='do not pace the pty at the baud rate')
+    parser.add_argument('--zero-copy', action='store_true', help='readinto + memoryview delivery')
+    parser.add_argument('--timeout', type=float, default=60, help='max seconds to wait for all frames')
+    args = parser.parse_args(argv)
+
+    hostcompat.install()
+    result = Bench(args).run()
+    width = max(len(k) for k in result)
+    for key, value in result.items():
+        print('{}  {}'.format(key.ljust(width), value))
+    return 0 if result['frames'].split('/')[0] == str(args.count) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
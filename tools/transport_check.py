@@ -0,0 +1,103 @@
+# Copyright (c) Quectel Wireless Solution, Co., Ltd.All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Host checks of the `qframe.builtins.transports` connection handling against a loopback TCP server.
+
+For every transport (threads, threads with zero-copy reads, reactor) the server sends a message and then closes the
+connection: the data must arrive once, no empty read may reach `on_data`, and the transport must reconnect.
+
+usage: python tools/transport_check.py
+"""
+
+import os
+import sys
+import time
+import socket
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import hostcompat  # noqa: E402
+
+
+class Server(object):
+    """loopback server keeping the accepted connections in `conns`."""
+
+    def __init__(self):
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.port = self.sock.getsockname()[1]
+        self.conns = []
+        threading.Thread(target=self.__accept, daemon=True).start()
+
+    def __accept(self):
+        while True:
+            conn, _ = self.sock.accept()
+            self.conns.append(conn)
+
+
+def wait(predicate, timeout=3):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def check_peer_close(name, make_transport):
+    from qframe.qsocket import TcpSocket
+    server = Server()
+    received = []
+    transport = make_transport(TcpSocket('127.0.0.1', server.port), lambda data: received.append(bytes(data)))
+    transport.start()
+    errors = []
+    if not wait(lambda: transport.is_connected() and server.conns):
+        errors.append('not connected')
+    else:
+        server.conns[0].sendall(b'hello')
+        wait(lambda: received)
+        server.conns[0].close()
+        if not wait(lambda: len(server.conns) > 1 and transport.is_connected()):
+            errors.append('no reconnect after peer close')
+        time.sleep(0.2)
+        if received != [b'hello']:
+            errors.append('received {} reads: {!r}'.format(len(received), received[:4]))
+        if transport.stats()['reconnects'] != 1:
+            errors.append('stats {}'.format(transport.stats()))
+    transport.disconnect()
+    print('{}: {}'.format(name, 'ok' if not errors else 'FAIL ' + '; '.join(errors)))
+    return len(errors)
+
+
+def main():
+    hostcompat.install()
+    from qframe.qsocket import Reactor
+    from qframe.builtins.transports import ThreadedTransport, ReactorTransport
+    reactor = Reactor()
+    options = {'reconnect_min': 0.1, 'reconnect_max': 0.2}
+    cases = [
+        ('threaded', lambda sock, on_data: ThreadedTransport(sock, on_data, **options)),
+        ('threaded zero-copy', lambda sock, on_data: ThreadedTransport(sock, on_data, zero_copy=True, **options)),
+        ('reactor', lambda sock, on_data: ReactorTransport(sock, on_data, reactor=reactor, **options)),
+    ]
+    failures = 0
+    for name, make_transport in cases:
+        failures += check_peer_close(name, make_transport)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
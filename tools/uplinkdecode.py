@@ -0,0 +1,92 @@
+# Copyright (c) Quectel Wireless Solution, Co., Ltd.All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Host side decoder for TcpClient streams sent with the 'compression' option.
+
+Splits a captured stream into envelopes (length, flag byte, body), inflates the deflated bodies with the same
+preset dictionary as the device and writes the payloads back to back.
+
+usage: python tools/uplinkdecode.py capture.bin --dict dictionary.bin --length-size 2 -o payload.bin
+"""
+
+import sys
+import zlib
+import argparse
+
+
+FLAG_DEFLATE = 0x01
+
+
+class DecodeError(Exception):
+    pass
+
+
+def decode(data, dictionary=b'', length_size=2):
+    """yield (flag, payload) for each envelope of `data`."""
+    pos = 0
+    while pos < len(data):
+        if pos + length_size > len(data):
+            raise DecodeError('truncated length at offset {}'.format(pos))
+        size = int.from_bytes(data[pos:pos + length_size], 'big')
+        start = pos + length_size
+        if size < 1 or start + size > len(data):
+            raise DecodeError('truncated envelope at offset {}'.format(pos))
+        flag = data[start]
+        body = data[start + 1:start + size]
+        if flag & FLAG_DEFLATE:
+            inflater = zlib.decompressobj(-15, zdict=dictionary) if dictionary else zlib.decompressobj(-15)
+            try:
+                body = inflater.decompress(body) + inflater.flush()
+            except zlib.error as e:
+                raise DecodeError('bad deflate body at offset {}: {}'.format(pos, e))
+        yield flag, body
+        pos = start + size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='decode QFrame compressed TcpClient streams.')
+    parser.add_argument('file', help='captured stream')
+    parser.add_argument('--dict', help='preset dictionary file, same content as the device configuration')
+    parser.add_argument('--length-size', type=int, default=2, help='size of the envelope length field')
+    parser.add_argument('-o', '--output', help='write payloads to this file instead of a summary on stdout')
+    args = parser.parse_args(argv)
+    dictionary = b''
+    if args.dict:
+        with open(args.dict, 'rb') as f:
+            dictionary = f.read()
+    with open(args.file, 'rb') as f:
+        data = f.read()
+    raw = compressed = 0
+    out = open(args.output, 'wb') if args.output else None
+    try:
+        for flag, payload in decode(data, dictionary, args.length_size):
+            if out is not None:
+                out.write(payload)
+            else:
+                print('{} {} {!r}'.format('deflate' if flag & FLAG_DEFLATE else 'stored', len(payload), payload[:48]))
+            raw += len(payload)
+            compressed += 1 if flag & FLAG_DEFLATE else 0
+    except DecodeError as e:
+        print('{}: {}'.format(args.file, e), file=sys.stderr)
+        return 1
+    finally:
+        if out is not None:
+            out.close()
+    print('{} bytes on the wire, {} bytes decoded, {} deflated envelopes'.format(len(data), raw, compressed),
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())